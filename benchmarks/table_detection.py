@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compares tabular_utils.detect_table_edges with the cell by cell implementation it replaced,
+checking that both find the same tables on random sheets made of several blocks.
+
+Usage, from the root of the repository:
+    python -m benchmarks.table_detection [--rows 5000] [--cols 200] [--tables 40] [--repeat 3]
+or, once the package is installed (e.g. with `pip install -e .`), python benchmarks/table_detection.py [...]
+"""
+import argparse
+from itertools import product
+import time
+
+import numpy as np
+import pandas as pd
+
+from nccr_cat_scripts.tabular_utils import detect_table_edges, point_in_any_table
+
+
+# --- Previous implementation, kept as the reference ---
+def legacy_detect_table(bool_df, point):
+    x, y = point
+    edges = np.array([[x, x], [y, y]])
+    nrows, ncols = bool_df.shape
+    maxs = ncols -1, nrows -1
+    while True:
+        changed = False
+        for n in range(2):  # x or y
+            for m in range(2):  # first or second edge
+                incr = 1 if m else -1
+                new_edges = edges.copy()
+                if 0 <= new_edges[n,m] + incr <=  maxs[n]:
+                    new_edges[n, m] += incr
+                else:
+                    continue
+                if n:
+                    non_empty = bool_df.iloc[new_edges[1,m], new_edges[0,0]:new_edges[0,1] + 1].any()
+                else:
+                    non_empty = bool_df.iloc[new_edges[1,0]:new_edges[1,1]+1, new_edges[0,m]].any()
+                if non_empty:
+                    changed = True
+                    edges = new_edges
+        if not changed:
+            break
+    return edges
+
+def legacy_detect_table_edges(bool_df):
+    nrows, ncols = bool_df.shape
+    coords = product(range(ncols), range(nrows))
+    seen = set()
+    table_edges = []
+    for point in coords:
+        if bool_df.iloc[point[1], point[0]] and (point not in seen) and not point_in_any_table(table_edges, point, padding=True, nrows=nrows, ncols=ncols):
+            new_table_edges = legacy_detect_table(bool_df, point)
+            table_edges.append(new_table_edges)
+        seen.add(point)
+    return table_edges
+# --- End of previous implementation ---
+
+
+def random_sheet(nrows, ncols, ntables, seed=0):
+    """A sheet with ntables blocks of random size and position, with a few holes and stray cells."""
+    rng = np.random.default_rng(seed)
+    values = np.full((nrows, ncols), np.nan)
+    for _ in range(ntables):
+        height, width = rng.integers(2, max(3, nrows // 10)), rng.integers(2, max(3, ncols // 5))
+        row, col = rng.integers(0, nrows - height), rng.integers(0, ncols - width)
+        values[row:row + height, col:col + width] = rng.random((height, width))
+    values[rng.random((nrows, ncols)) < 0.01] = np.nan
+    values[rng.random((nrows, ncols)) < 0.001] = 1
+    return pd.DataFrame(values)
+
+
+def timed(func, *args, repeat=1):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--cols", type=int, default=200)
+    parser.add_argument("--tables", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the new implementation, the best is kept.")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the new implementation.")
+    args = parser.parse_args()
+
+    bool_df = random_sheet(args.rows, args.cols, args.tables).notna()
+    edges, new_time = timed(detect_table_edges, bool_df, repeat=args.repeat)
+    print(f"{args.rows}x{args.cols} sheet, {len(edges)} tables")
+    print(f"detect_table_edges: {new_time:.3f} s")
+    if args.skip_legacy:
+        return
+    legacy_edges, legacy_time = timed(legacy_detect_table_edges, bool_df)
+    print(f"legacy:             {legacy_time:.3f} s ({legacy_time / new_time:.0f}x slower)")
+    same = len(edges) == len(legacy_edges) and all((a == b).all() for a, b in zip(edges, legacy_edges))
+    print("same tables" if same else "DIFFERENT TABLES")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,24 @@ Created on Wed Jan  7 16:29:52 2026
 """
 
 from collections.abc import Collection
+from contextlib import contextmanager
+import logging
 import os
+import shutil
+import tempfile
+
+
+# Files are read, decoded, compressed and written in chunks of this many bytes, so that memory stays bounded
+CHUNK_SIZE = 1024 * 1024
+LINK_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+# Methods tried in order for each requested mode: the cheapest first, falling back to a plain copy
+LINK_FALLBACKS = {
+    'symlink': ('symlink', 'hardlink', 'reflink', 'copy'),
+    'hardlink': ('hardlink', 'reflink', 'copy'),
+    'reflink': ('reflink', 'copy'),
+    'copy': ('copy',),
+}
+FICLONE = 0x40049409 # Linux ioctl sharing the extents of a file (btrfs, XFS, ...)
 
 
 def islistlike(obj):
@@ -38,4 +55,89 @@ def harmonize_ext(ext):
 
 def split(path):
     first, second = os.path.split(path)
-    return (first if first else None, second)
\ No newline at end of file
+    return (first if first else None, second)
+
+def reflink(src, dst):
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("Reflinks are not supported on this platform") from None
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+def link_or_copy(src, dst, mode='copy'):
+    """
+    Makes dst a link to, or a copy of, src, trying the methods of LINK_FALLBACKS[mode] in order
+    until one is supported by the filesystem. Returns the method that was used.
+    """
+    if os.path.abspath(src) == os.path.abspath(dst):
+        raise ValueError(f"Source and destination are the same file: {src}")
+    for method in LINK_FALLBACKS[mode]:
+        # Links cannot overwrite, and copying onto a previous link would write into src
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            if method == 'symlink':
+                os.symlink(os.path.abspath(src), dst)
+            elif method == 'hardlink':
+                os.link(src, dst)
+            elif method == 'reflink':
+                reflink(src, dst)
+            else:
+                shutil.copy2(src, dst)
+            return method
+        except OSError:
+            if method == 'copy':
+                raise
+
+def init_worker(logger_name, level):
+    # Workers started with 'spawn' re-import the modules, so their loggers do not inherit the chosen verbosity
+    logging.getLogger(logger_name).setLevel(level)
+
+def current_umask():
+    # The umask can only be read by setting it, so it is set back right away
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+def _fsync_dir(folder):
+    # Makes a rename in folder durable. Directories cannot be opened like this on Windows, where it is not needed.
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@contextmanager
+def replacing(dest, mode_from=None, durable=False, buffering=-1):
+    """
+    Yields a temporary binary file next to dest, which atomically replaces dest once the block completes
+    without error, and is removed otherwise. The new dest gets the permissions of mode_from if given, and
+    those of a newly created file otherwise (mkstemp creates it readable by the owner only).
+    With durable, the file and the rename are fsynced, so that after a crash dest is either
+    untouched or fully replaced.
+    """
+    folder = os.path.dirname(os.path.abspath(dest))
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=f".{os.path.basename(dest)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w+b', buffering=buffering) as temp_file:
+            yield temp_file
+            if durable:
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+        if mode_from:
+            shutil.copymode(mode_from, temp_path)
+        else:
+            os.chmod(temp_path, 0o666 & ~current_umask())
+        os.replace(temp_path, dest)
+        if durable:
+            _fsync_dir(folder)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -8,15 +8,20 @@ Created on Wed Nov 26 16:44:53 2025
 """
 
 import argparse
+from functools import lru_cache
 import importlib
 import io
-from itertools import product
 import logging
 import os
+import posixpath
 import re
 import shutil as sh
 import sys
 from typing import Any, Callable, Dict, List, Match, Optional, Pattern, Tuple, Union
+from xml.etree import ElementTree as ET
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+import zipfile as zf
 
 
 import numpy as np
@@ -24,6 +29,7 @@ import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.utils.cell import column_index_from_string, get_column_letter
 from nccr_cat_scripts import helpers
+from nccr_cat_scripts.zip_utils import copy_member_raw
 
 # --- Logger Setup ---
 logger = logging.getLogger(__name__)
@@ -40,12 +46,42 @@ logger.addHandler(handler)
 # Regex to find cell references in formulas (e.g., A1, B2, or Sheet1!A1)
 # 1. Sheet Name part (optional, group 1): (?:'([^']+)'!)? OR ([A-Za-z0-9_]+!)?
 #    - We use the simpler version here: capture (SheetName!)? or (CellRef)
-CELL_REF_REGEX: Pattern[str] = re.compile(r"((?:'[^']+'!)?|(?:\w+!)?)([A-Z]+)(\d+)")
+# 2. Column and row (groups 3 and 5), each optionally made absolute by a "$" (groups 2 and 4)
+CELL_REF_REGEX: Pattern[str] = re.compile(r"((?:'[^']+'!)?|(?:\w+!)?)(\$?)([A-Z]+)(\$?)(\d+)")
 PROCESS_EXTENSIONS: Tuple[str, ...] = ("xlsx", "xls") 
 STRICT_SEP_EXTENSIONS: Tuple[str, ...] = ("csv", "tsv")
 WIDE_SEP_EXTENSIONS: Tuple[str, ...] = ("csv", "tsv", "txt", "dat")
 EXT_TO_SEP = {"csv": ",", "tsv": "\t", "txt": "\s+", "dat": "\s+"}
 TABULAR_EXTENSIONS: Tuple[str, ...] = PROCESS_EXTENSIONS + STRICT_SEP_EXTENSIONS
+# Text that would be changed by str.strip()
+STRIP_PATTERN: Pattern[str] = re.compile(r"^\s|\s$")
+# Inferred dtypes of the columns containing strings (e.g. not only booleans or numbers with blanks)
+TEXT_INFERRED_DTYPES: Tuple[str, ...] = ("string", "mixed", "mixed-integer")
+XLSX_ENGINES: Tuple[str, ...] = ("openpyxl", "xml")
+# Cell references in the attributes of sheet XML parts (ranges such as "A1:C5" or lists such as "A1 B2:B4")
+ATTRIBUTE_REF_REGEX: Pattern[str] = re.compile(r"(\$?)([A-Z]{1,3})(\$?)(\d+)")
+# Characters to escape when writing XML back, most values have none
+XML_ATTR_SPECIAL: Pattern[str] = re.compile(r'[&<>"\n\r\t]')
+XML_TEXT_SPECIAL: Pattern[str] = re.compile(r"[&<>\r]")
+# Attributes holding cell references, per element of worksheet and table parts
+XLSX_REF_ATTRIBUTES: Dict[str, Tuple[str, ...]] = {
+    "dimension": ("ref",), "mergeCell": ("ref",), "hyperlink": ("ref",), "f": ("ref",),
+    "table": ("ref",), "autoFilter": ("ref",), "sortState": ("ref",), "sortCondition": ("ref",),
+    "conditionalFormatting": ("sqref",), "dataValidation": ("sqref",), "protectedRange": ("sqref",),
+    "ignoredError": ("sqref",), "selection": ("activeCell", "sqref"), "pane": ("topLeftCell",), "comment": ("ref",),
+}
+# SpreadsheetML main namespace (transitional and strict), the one of the <row> and <c> elements of <sheetData>
+XLSX_MAIN_NAMESPACES: Tuple[str, ...] = (
+    "http://schemas.openxmlformats.org/spreadsheetml/2006/main", "http://purl.oclc.org/ooxml/spreadsheetml/main",
+)
+# Parts related to a worksheet whose cell positions move with its padding
+XLSX_SHEET_PARTS: Tuple[str, ...] = ("table", "comments", "drawing", "vmlDrawing")
+# Elements whose text is a formula, per kind of part (the last token of its content type)
+XLSX_FORMULA_ELEMENTS: Dict[str, Tuple[str, ...]] = {
+    "worksheet": ("f", "formula", "formula1", "formula2"),
+    "main": ("definedName",),
+    "chart": ("f",),
+}
 
 class InvalidFileFormatError(ValueError):
     """Raised when the file content does not match the expected format or schema."""
@@ -126,23 +162,29 @@ def update_cross_sheet_formula(
     """
     if formula is None:
         return formula
+    # End and sheet reference of the last cell reference, for the second half of ranges like Sheet2!A1:B2
+    previous = {'end': -1, 'sheet_ref': ''}
 
     def replace_cell_ref(match: Match[str]) -> str:
         """Callback function for the regex substitute."""
         
         # Group 1: Sheet reference (e.g., 'Sheet2!' or empty string for same-sheet)
-        # Group 2: Column reference (e.g., A)
-        # Group 3: Row reference (e.g., 1)
-        sheet_ref, col_ref, row_ref = match.groups()
+        # Group 3: Column reference (e.g., A)
+        # Group 5: Row reference (e.g., 1)
+        sheet_ref, col_abs, col_ref, row_abs, row_ref = match.groups()
+        # The end of a range is on the sheet of its start
+        in_range = not sheet_ref and previous['end'] >= 0 and match.start() == previous['end'] + 1 and formula[previous['end']] == ":"
+        target_ref = previous['sheet_ref'] if in_range else sheet_ref
+        previous['end'], previous['sheet_ref'] = match.end(), target_ref
         
         # 1. Determine which sheet's padding map to use
         target_sheet_name = source_sheet_name # Default to the sheet containing the formula
         
-        # If sheet_ref exists, it's a cross-sheet reference
-        if sheet_ref:
+        # If target_ref exists, it's a cross-sheet reference
+        if target_ref:
             # Extract the sheet name from the reference (remove quotes, exclamation mark)
             # Examples: 'Sheet 2'! => 'Sheet 2', Sheet3! => Sheet3
-            target_sheet_name = sheet_ref.strip("'!").strip()
+            target_sheet_name = target_ref.strip("'!").strip()
             
             # If the target sheet doesn't exist in the map (e.g., it was deleted 
             # or is an external link), we cannot apply a correction.
@@ -179,7 +221,7 @@ def update_cross_sheet_formula(
         new_col_ref = get_column_letter(new_col_idx)
         
         # Reconstruct the reference using the original sheet reference string
-        return f"{sheet_ref}{new_col_ref}{new_row}"
+        return f"{sheet_ref}{col_abs}{new_col_ref}{row_abs}{new_row}"
 
     # Use the regex to find all cell references and replace them using the callback
     return CELL_REF_REGEX.sub(replace_cell_ref, formula)
@@ -296,11 +338,410 @@ def unpad_strip_xlsx_file(filename: str, outname: str, unpad: bool, strip_text:
         logger.error(f"Error saving file {os.path.basename(outname)}: {e}")
         return False
 
+###############################################################################
+# Direct sheet XML handling for unpadding and text stripping
+###############################################################################
+
+@lru_cache(maxsize=None)
+def _local_name(name: str) -> str:
+    return name.rpartition(":")[2].rpartition("}")[2]
+
+def _qualified_name(prefix: str, local: str) -> str:
+    return f"{prefix}:{local}" if prefix else local
+
+def _split_cell_ref(ref: str) -> Tuple[int, int]:
+    """Returns the (row, column) indices of a reference such as "C5"."""
+    match = ATTRIBUTE_REF_REGEX.match(ref)
+    return int(match.group(4)), column_index_from_string(match.group(2))
+
+def _shift_ref(ref: str, rows: int, cols: int) -> str:
+    """Moves every cell of a reference attribute up by rows and left by cols, without going past A1."""
+    if not rows and not cols:
+        return ref
+    def shift(match: Match[str]) -> str:
+        col_abs, col, row_abs, row = match.groups()
+        new_col = max(1, column_index_from_string(col) - cols)
+        return f"{col_abs}{get_column_letter(new_col)}{row_abs}{max(1, int(row) - rows)}"
+    return ATTRIBUTE_REF_REGEX.sub(shift, ref)
+
+def _xml_attr(value: str) -> str:
+    if not XML_ATTR_SPECIAL.search(value):
+        return value
+    return escape(value, {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"})
+
+def _xml_text(text: str) -> str:
+    if not XML_TEXT_SPECIAL.search(text):
+        return text
+    return escape(text, {"\r": "&#13;"})
+
+def _xlsx_content_types(zf_in: zf.ZipFile) -> Dict[str, str]:
+    """Maps the parts of an xlsx package to their kind, e.g. 'worksheet', 'sharedStrings' or 'main' (the workbook)."""
+    kinds = {}
+    for element in ET.fromstring(zf_in.read("[Content_Types].xml")):
+        if _local_name(element.tag) == "Override":
+            kinds[element.get("PartName").lstrip("/")] = element.get("ContentType").rpartition("+")[0].rpartition(".")[2]
+    return kinds
+
+def _part_relationships(zf_in: zf.ZipFile, part: str) -> Dict[str, Tuple[str, str]]:
+    """Maps the relationship ids of a part to their type (e.g. 'worksheet') and the part they target."""
+    folder, name = posixpath.split(part)
+    rels_name = posixpath.join(folder, "_rels", f"{name}.rels")
+    if rels_name not in zf_in.NameToInfo:
+        return {}
+    targets = {}
+    for element in ET.fromstring(zf_in.read(rels_name)):
+        if element.get("TargetMode") == "External":
+            continue
+        target = element.get("Target")
+        target = target[1:] if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+        targets[element.get("Id")] = (element.get("Type").rpartition("/")[2], target)
+    return targets
+
+def _xlsx_structure(zf_in: zf.ZipFile) -> Tuple[Dict[str, str], List[Tuple[str, str, str]], Dict[str, str]]:
+    """
+    Reads how an xlsx package is organised.
+    
+    Returns: (kind of each part, [(sheet name, sheetId, part)] of the worksheets, sheet name owning each worksheet part
+              and each part of XLSX_SHEET_PARTS)
+    """
+    kinds = _xlsx_content_types(zf_in)
+    workbook_part = next(part for part, kind in kinds.items() if kind == "main")
+    relationships = _part_relationships(zf_in, workbook_part)
+    sheets = []
+    for element in ET.fromstring(zf_in.read(workbook_part)).iter():
+        if _local_name(element.tag) != "sheet":
+            continue
+        rel_id = next(value for key, value in element.attrib.items() if _local_name(key) == "id")
+        part = relationships.get(rel_id, (None, None))[1]
+        if kinds.get(part) == "worksheet":
+            sheets.append((element.get("name"), element.get("sheetId"), part))
+    owners = {}
+    for name, _, part in sheets:
+        owners[part] = name
+        for kind, target in _part_relationships(zf_in, part).values():
+            if kind in XLSX_SHEET_PARTS:
+                owners[target] = name
+                # Legacy VML drawings only have a default content type, by extension
+                if not kinds.get(target):
+                    kinds[target] = kind
+    return kinds, sheets, owners
+
+def _xlsx_sheet_padding(stream) -> Tuple[int, int]:
+    """
+    Streams a worksheet part to find its padding: the rows above and the columns left of every cell with a value.
+    
+    Returns: (rows_to_delete, cols_to_delete)
+    """
+    state = {"row": 0, "col": 0, "in_cell": False, "top": None, "left": None}
+    def start(name, attrs):
+        local = _local_name(name)
+        if local == "row":
+            state["row"] = int(attrs["r"]) if "r" in attrs else state["row"] + 1
+            state["col"] = 0
+        elif local == "c":
+            state["col"] = _split_cell_ref(attrs["r"])[1] if "r" in attrs else state["col"] + 1
+            state["in_cell"] = True
+        elif state["in_cell"] and local in ("v", "f", "is"):
+            if state["top"] is None:
+                state["top"] = state["row"]
+            state["left"] = state["col"] if state["left"] is None else min(state["left"], state["col"])
+    def end(name):
+        if _local_name(name) == "c":
+            state["in_cell"] = False
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.ParseFile(stream)
+    return (state["top"] or 1) - 1, (state["left"] or 1) - 1
+
+class _XlsxPartRewriter:
+    """
+    Streams an XML part of an xlsx package through expat and writes it back to out, with the padding of the
+    sheets removed from its cell references, and optionally the text of its string items (<si>, <is>) stripped.
+    Cells and rows in the padding of a worksheet are dropped, they hold no value, only formatting.
+    Only the <row> and <c> elements of <sheetData> are sheet rows and cells: other elements with these local
+    names (e.g. the <xdr:row> of form control and OLE object anchors) are positions, shifted like in drawings.
+    """
+    FLUSH_EVERY = 4096
+    
+    def __init__(self, out, padding_map: Dict[str, Dict[str, Any]], sheet_name: Optional[str] = None,
+                 worksheet: bool = False, formula_elements: Tuple[str, ...] = (), strip_text: bool = False,
+                 sheets_by_id: Optional[Dict[str, str]] = None):
+        self.out = out
+        self.padding_map = padding_map
+        self.sheet_name = sheet_name
+        self.rows, self.cols = self._padding(sheet_name)
+        self.worksheet = worksheet
+        self.formula_elements = formula_elements
+        self.strip_text = strip_text
+        # Only given for the calculation chain, whose cells refer to sheets by id
+        self.sheets_by_id = sheets_by_id
+        self.pieces = []
+        self.pending = False # The last start tag was written without its closing ">"
+        self.skip = 0 # Depth inside a dropped element
+        self.text = None # Text of the formula, <t> or anchor being read
+        self.transform = None # Applied to self.text once read
+        self.anchor = False # Inside the from/to cell anchor of a drawing
+        self.item = None # [(piece index, text)] of the <t> elements of the string item being read
+        self.phonetic = 0
+        self.row = self.col = 0
+        self.calc_padding = (0, 0)
+        self.depth = 0 # Of the element being read, the root being at 1
+        self.main_prefix = None # Prefix of the main namespace, declared on the root of a worksheet
+        self.sheet_data = False # Inside the <sheetData> of a worksheet
+    
+    def _padding(self, sheet_name: Optional[str]) -> Tuple[int, int]:
+        padding = self.padding_map.get(sheet_name, {'rows': 0, 'cols': 0})
+        return padding['rows'], padding['cols']
+    
+    def rewrite(self, stream):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.XmlDeclHandler = self.xml_decl
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.characters
+        parser.CommentHandler = self.comment
+        parser.ProcessingInstructionHandler = self.processing_instruction
+        parser.ParseFile(stream)
+        self.flush()
+    
+    def flush(self):
+        self.out.write("".join(self.pieces).encode("utf-8"))
+        self.pieces = []
+    
+    def emit(self, piece: str):
+        if self.pending:
+            self.pieces.append(">")
+            self.pending = False
+        self.pieces.append(piece)
+    
+    def xml_decl(self, version, encoding, standalone):
+        standalone = "" if standalone == -1 else f' standalone="{"yes" if standalone else "no"}"'
+        self.pieces.append(f'<?xml version="{version}" encoding="UTF-8"{standalone}?>\n')
+    
+    def start(self, name, attrs):
+        if self.skip:
+            self.skip += 1
+            return
+        local = _local_name(name)
+        self.depth += 1
+        if self.worksheet and self.depth == 1:
+            self.main_prefix = next((key[6:] for key, value in attrs.items()
+                                     if key.startswith("xmlns") and key[5:6] in ("", ":") and value in XLSX_MAIN_NAMESPACES), None)
+        elif self.worksheet and self.depth == 2 and local == "sheetData":
+            self.sheet_data = self.main_prefix is not None and name == _qualified_name(self.main_prefix, local)
+        if self.sheet_data and self.depth == 3 and local == "row":
+            self.row = int(attrs["r"]) if "r" in attrs else self.row + 1
+            self.col = 0
+            if self.row <= self.rows:
+                self.depth -= 1
+                self.skip = 1
+                return
+            if self.rows:
+                attrs["r"] = str(self.row - self.rows)
+            if self.cols and "spans" in attrs:
+                attrs["spans"] = " ".join(":".join(str(max(1, int(n) - self.cols)) for n in span.split(":"))
+                                          for span in attrs["spans"].split())
+        elif self.sheet_data and self.depth == 4 and local == "c":
+            self.col = _split_cell_ref(attrs["r"])[1] if "r" in attrs else self.col + 1
+            if self.col <= self.cols:
+                self.depth -= 1
+                self.skip = 1
+                return
+            if self.rows or self.cols:
+                attrs["r"] = f"{get_column_letter(self.col - self.cols)}{self.row - self.rows}"
+        elif self.sheets_by_id is not None and local == "c":
+            # Cells without a sheet id are on the same sheet as the previous one
+            if "i" in attrs:
+                self.calc_padding = self._padding(self.sheets_by_id.get(attrs["i"]))
+            attrs["r"] = _shift_ref(attrs["r"], *self.calc_padding)
+        elif self.strip_text and local == "tableColumn" and "name" in attrs:
+            # Table column names must match their (stripped) header cells
+            attrs["name"] = attrs["name"].strip()
+        elif local == "worksheetSource" and "ref" in attrs:
+            attrs["ref"] = _shift_ref(attrs["ref"], *self._padding(attrs.get("sheet")))
+        for attr in XLSX_REF_ATTRIBUTES.get(local, ()):
+            if attr in attrs:
+                attrs[attr] = _shift_ref(attrs[attr], self.rows, self.cols)
+        
+        self.emit("".join([f"<{name}", *(f' {key}="{_xml_attr(value)}"' for key, value in attrs.items())]))
+        self.pending = True
+        if local in self.formula_elements:
+            self._capture(lambda text: update_cross_sheet_formula(text, self.sheet_name, self.padding_map))
+        elif local in ("from", "to"):
+            self.anchor = True
+        elif self.anchor and local in ("row", "col") or local in ("Row", "Column"):
+            # Drawing anchors (<xdr:row>) and legacy VML comment positions (<x:Row>) count from 0
+            shift = self.rows if local in ("row", "Row") else self.cols
+            self._capture(lambda text: str(max(0, int(text) - shift)))
+        elif local == "Anchor":
+            # Legacy VML anchor: left column, offset, top row, offset, right column, offset, bottom row, offset
+            self._capture(self._shift_vml_anchor)
+        elif self.strip_text and local in ("si", "is"):
+            self.item = []
+        elif local == "rPh":
+            self.phonetic += 1
+        elif local == "t" and self.item is not None and not self.phonetic:
+            self.text = []
+    
+    def _capture(self, transform: Callable[[str], str]):
+        self.text = []
+        self.transform = transform
+    
+    def _shift_vml_anchor(self, text: str) -> str:
+        values = [int(value) for value in text.split(",")]
+        for n, shift in ((0, self.cols), (2, self.rows), (4, self.cols), (6, self.rows)):
+            values[n] = max(0, values[n] - shift)
+        return ", ".join(str(value) for value in values)
+    
+    def end(self, name):
+        if self.skip:
+            self.skip -= 1
+            return
+        local = _local_name(name)
+        self.depth -= 1
+        if self.sheet_data and self.depth == 1:
+            self.sheet_data = False
+        if self.text is not None:
+            text = "".join(self.text)
+            self.text = None
+            if local == "t":
+                if text:
+                    self.emit("")
+                    self.item.append((len(self.pieces), text))
+                    self.pieces.append(_xml_text(text))
+            elif text.strip():
+                self.emit(_xml_text(self.transform(text)))
+            elif text:
+                self.emit(_xml_text(text))
+        elif local in ("from", "to"):
+            self.anchor = False
+        elif local == "rPh":
+            self.phonetic -= 1
+        elif local in ("si", "is") and self.item is not None:
+            self._strip_item()
+            self.item = None
+        
+        if self.pending:
+            self.pieces.append("/>")
+            self.pending = False
+        else:
+            self.pieces.append(f"</{name}>")
+        if self.item is None and len(self.pieces) > self.FLUSH_EVERY:
+            self.flush()
+    
+    def _strip_item(self):
+        """Strips a string item as a whole: its leading and trailing whitespace can span several rich text runs."""
+        texts = self.item
+        for n, (index, text) in enumerate(texts):
+            texts[n] = (index, text.lstrip())
+            if texts[n][1]:
+                break
+        for n in reversed(range(len(texts))):
+            index, text = texts[n]
+            texts[n] = (index, text.rstrip())
+            if texts[n][1]:
+                break
+        for index, text in texts:
+            self.pieces[index] = _xml_text(text)
+    
+    def characters(self, data):
+        if self.skip:
+            return
+        if self.text is not None:
+            self.text.append(data)
+        else:
+            self.emit(_xml_text(data))
+    
+    def comment(self, data):
+        if not self.skip:
+            self.emit(f"<!--{data}-->")
+    
+    def processing_instruction(self, target, data):
+        if not self.skip:
+            self.emit(f"<?{target} {data}?>")
+
+def unpad_strip_xlsx_xml(filename: str, outname: str, unpad: bool, strip_text: bool) -> bool:
+    """
+    Alternative to unpad_strip_xlsx_file working on the XML parts of the xlsx package rather than on an openpyxl workbook.
+    1. Streams every worksheet part once to determine its padding.
+    2. Streams the parts that need it into the new package, shifting the cell references of cells, rows, merged ranges,
+       dimensions, tables, etc. and rewriting formulas with the global padding map, and/or stripping the shared and inline strings.
+    3. Copies every other part (styles, images, ...) without recompressing it.
+    Nothing is held in memory beyond the part being rewritten, and the workbook keeps everything openpyxl would drop (charts, images, ...).
+    
+    Args:
+        filename: Path to the source file.
+        outname: Path to save the processed file (can be filename itself).
+        unpad: If True, padding rows/cols are deleted.
+        strip_text: If True, all text cell values are stripped.
+        
+    Returns:
+        True if successful, False otherwise.
+    """
+    if not os.path.exists(filename):
+        logger.error(f"File not found: {filename}")
+        return False
+        
+    logger.info(f"Processing: {os.path.basename(filename)} (Unpad: {unpad}, Strip: {strip_text})")
+    
+    try:
+        # The output is written next to outname and replaces it once complete, so filename can be outname
+        with helpers.replacing(outname, mode_from=outname if os.path.exists(outname) else None) as temp_file, \
+                zf.ZipFile(filename) as zf_in:
+            kinds, sheets, owners = _xlsx_structure(zf_in)
+            
+            # 1. First Pass: Determine Padding for ALL Sheets (if requested)
+            all_sheets_padding_map = {name: {'rows': 0, 'cols': 0} for name, _, _ in sheets}
+            if unpad:
+                for name, _, part in sheets:
+                    with zf_in.open(part) as stream:
+                        rows_to_delete, cols_to_delete = _xlsx_sheet_padding(stream)
+                    all_sheets_padding_map[name] = {'rows': rows_to_delete, 'cols': cols_to_delete}
+                    if rows_to_delete > 0 or cols_to_delete > 0:
+                        logger.info(f"  Sheet '{name}': Found {rows_to_delete} padding row(s), {cols_to_delete} padding col(s).")
+            shifted = any(padding['rows'] or padding['cols'] for padding in all_sheets_padding_map.values())
+            
+            # 2. Second Pass: Rewrite the parts affected, copy the others
+            with zf.ZipFile(temp_file, 'w', zf.ZIP_DEFLATED) as zf_out:
+                for info in zf_in.infolist():
+                    kind = kinds.get(info.filename)
+                    formula_elements = XLSX_FORMULA_ELEMENTS.get(kind, ()) if shifted else ()
+                    options = None
+                    if kind == "worksheet" and (shifted or strip_text):
+                        options = dict(sheet_name=owners.get(info.filename), worksheet=True, strip_text=strip_text)
+                    elif kind in ("comments", "drawing", "vmlDrawing") and shifted:
+                        options = dict(sheet_name=owners.get(info.filename))
+                    elif kind == "table" and (shifted or strip_text):
+                        options = dict(sheet_name=owners.get(info.filename), strip_text=strip_text)
+                    elif kind == "sharedStrings" and strip_text:
+                        options = dict(strip_text=True)
+                    elif kind == "calcChain" and shifted:
+                        options = dict(sheets_by_id={sheet_id: name for name, sheet_id, _ in sheets})
+                    elif kind in ("main", "chart", "pivotCacheDefinition") and shifted:
+                        options = {}
+                    if options is None:
+                        copy_member_raw(zf_in, info, zf_out)
+                        continue
+                    out_info = zf.ZipInfo(info.filename, date_time=info.date_time)
+                    out_info.compress_type = zf.ZIP_DEFLATED
+                    with zf_in.open(info) as stream, zf_out.open(out_info, 'w', force_zip64=info.file_size > zf.ZIP64_LIMIT // 2) as out:
+                        rewriter = _XlsxPartRewriter(out, all_sheets_padding_map, formula_elements=formula_elements, **options)
+                        rewriter.rewrite(stream)
+    except Exception as e:
+        logger.error(f"Error processing workbook {filename}: {e}")
+        if os.path.abspath(filename) != os.path.abspath(outname):
+            sh.copy(filename, outname) # Copy source to destination for safety
+        return False
+    logger.info(f"Successfully processed {os.path.basename(filename)}.")
+    return True
+
 ###############################################################################
 # Pandas worksheet handling for unpadding and text stripping
 ###############################################################################
 
-def get_padding_info_df(df: pd.DataFrame, amount: Optional[bool] = False) -> pd.DataFrame:
+def get_padding_info_df(df: pd.DataFrame, amount: Optional[bool] = False) -> Tuple[int, int, int, int]:
     """
     Returns padding info of a DataFrame
 
@@ -309,25 +750,19 @@ def get_padding_info_df(df: pd.DataFrame, amount: Optional[bool] = False) -> pd.
         amount: False returns the index of the first non empty row/column from each side, True returns the number of empty rows/columns
 
     Returns:
-        the unpadded DataFrame
+        (top, bottom, left, right) as indices or amounts. A DataFrame without any value has no padding:
+        (0, 0, 0, 0) as amounts, and (0, -1, 0, -1) as indices, i.e. nothing to keep.
     
 
     """
-    x1, y1 = 0, 0
-    x2, y2 = [dim - 1 for dim in df.shape]
-    count_x2, count_y2 = 0, 0
-    while df.iloc[x1].isna().all():
-        x1 += 1
-    while df.iloc[:, y1].isna().all():
-        y1 += 1
-    while df.iloc[x2].isna().all():
-        if amount:
-            count_x2 += 1
-        x2 -= 1
-    while df.iloc[:, y2].isna().all():
-        if amount:
-            count_y2 += 1
-        y2 -= 1
+    filled = df.notna().to_numpy()
+    filled_rows, filled_cols = filled.any(axis=1), filled.any(axis=0)
+    if not filled_rows.any():
+        return (0, 0, 0, 0) if amount else (0, -1, 0, -1)
+    # argmax finds the first filled row/column from each side
+    x1, count_x2 = int(filled_rows.argmax()), int(filled_rows[::-1].argmax())
+    y1, count_y2 = int(filled_cols.argmax()), int(filled_cols[::-1].argmax())
+    x2, y2 = len(filled_rows) - 1 - count_x2, len(filled_cols) - 1 - count_y2
     return (x1, count_x2, y1, count_y2) if amount else (x1, x2, y1, y2)
 
 
@@ -346,10 +781,45 @@ def unpad_df(df: pd.DataFrame) -> pd.DataFrame:
     x1, x2, y1, y2 = get_padding_info_df(df)
     return df.iloc[x1:x2+1, y1:y2+1]
 
+def _text_columns(df: pd.DataFrame) -> List[int]:
+    """
+    Positions of the columns holding text (object or string dtype columns with at least a string),
+    the only ones supporting the Series.str accessor.
+    """
+    return [j for j, dtype in enumerate(df.dtypes)
+            if (dtype == object or pd.api.types.is_string_dtype(dtype))
+            and pd.api.types.infer_dtype(df.iloc[:, j], skipna=True) in TEXT_INFERRED_DTYPES]
+
+def find_strip_cells(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the text cells starting or ending with whitespace, checking only object/string columns
+    with vectorized Series.str operations.
+
+    Returns:
+        the row and column positions (not labels) of these cells, as two NumPy arrays, column by column
+    """
+    rows, cols = [], []
+    for j in _text_columns(df):
+        # Non-string values (numbers, NaN) give NaN, counted as False
+        positions = np.flatnonzero(df.iloc[:, j].str.contains(STRIP_PATTERN, na=False).to_numpy(dtype=bool))
+        rows.append(positions)
+        cols.append(np.full(len(positions), j))
+    if not rows:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    return np.concatenate(rows), np.concatenate(cols)
+
 def strip_text_df(df: pd.DataFrame) -> pd.DataFrame:
-    t = df.copy()
-    stripvalue = lambda x: x if not isinstance(x, str) else x.strip()
-    return t.map(stripvalue) if hasattr(t, "map") else t.applymap(stripvalue)
+    """
+    Strips the text cells of a DataFrame. Only the text columns that need it are replaced,
+    the others (e.g. numeric columns) are shared with df rather than copied.
+    """
+    t = df.copy(deep=False)
+    for j in np.unique(find_strip_cells(df)[1]):
+        column = df.iloc[:, j]
+        stripped = column.str.strip()
+        # Values that are not strings come out as NaN, and are kept as they were
+        t.isetitem(int(j), stripped.where(stripped.notna(), column))
+    return t
 
 def unpad_strip_xls_file(filename: str, outname: str, unpad: bool, strip_text: bool) -> None:
     if int(pd.__version__.split(".")[0]) >= 2:
@@ -401,14 +871,17 @@ def unpad_strip_csv_file(filename: str, outname: str, unpad: bool, strip_text: b
 # Format-agnostic unpadding and text stripping and checking
 ###############################################################################
 
-def unpad_strip_file(source_path, dest_path, ext, unpad, strip_text):
+def unpad_strip_file(source_path, dest_path, ext, unpad, strip_text, xlsx_engine="openpyxl"):
     if helpers.isdir(dest_path):
         destfname= os.path.split(source_path)[1]
         dest_path = os.path.join(dest_path, destfname)
         
     if ext == "xlsx":
         # Process Excel files
-        unpad_strip_xlsx_file(source_path, dest_path, unpad, strip_text)
+        if xlsx_engine == "xml":
+            unpad_strip_xlsx_xml(source_path, dest_path, unpad, strip_text)
+        else:
+            unpad_strip_xlsx_file(source_path, dest_path, unpad, strip_text)
     else:
         if ext == "xls":
             unpad_strip_xls_file(source_path, dest_path, unpad, strip_text)
@@ -422,7 +895,7 @@ def unpad_strip_file(source_path, dest_path, ext, unpad, strip_text):
                 logger.error(f"Error copying non-Excel file {source_path}: {e}")
                 
 def unpad_strip_recursively(source_fol: str, dest_fol: str, unpad: bool, strip_text: bool,
-                            in_formats: Optional[Union[List, str]]):
+                            in_formats: Optional[Union[List, str]], xlsx_engine: str = "openpyxl"):
     """Recursively processes all tabular data files in a folder."""
     source_fol = os.path.abspath(source_fol)
     dest_fol = helpers.check_and_clean_folderpath(os.path.abspath(dest_fol))
@@ -455,7 +928,7 @@ def unpad_strip_recursively(source_fol: str, dest_fol: str, unpad: bool, strip_t
                 source_path = os.path.join(fol, file)
                 dest_path = os.path.join(correspfol, file)
                 logger.info(f"unpadding and/or stripping {source_path}")
-                unpad_strip_file(source_path, dest_path, ext, unpad, strip_text)
+                unpad_strip_file(source_path, dest_path, ext, unpad, strip_text, xlsx_engine=xlsx_engine)
                 
     logger.info(f"--- Folder Process Complete: {os.path.basename(dest_fol)} ---")
 
@@ -480,7 +953,7 @@ def check_xls_file(filename: str, check_padding: bool, check_strip: bool) -> Opt
     issues = {'padding_found': False, 'strip_issues': False, 'details': {}}
     
     for name, df in dfs.items():
-        sheet_issues = {'padding': (0, 0), 'strip_cells': []}
+        sheet_issues = {'padding': (0, 0, 0, 0), 'strip_cells': []}
         
         # 1. Check Padding
         if check_padding:
@@ -492,25 +965,43 @@ def check_xls_file(filename: str, check_padding: bool, check_strip: bool) -> Opt
         # 2. Check Text Stripping
         if check_strip:
             # We only need to check the remaining cells (i.e., skipping any padded area)
-            start_row = sheet_issues['padding'][0] + 1
-            start_col = sheet_issues['padding'][1] + 1
-            
-            for n, row in df.iloc[start_row:, start_col:].iter_rows():
-                for m, cell in enumerate(row):
-                    # Check for text (data_type 's') that starts or ends with space
-                    if isinstance(cell, str):
-                        if cell.value.startswith(' ') or cell.value.endswith(' '):
-                            issues['strip_issues'] = True
-                            sheet_issues['strip_cells'].append([n + start_row, m + start_col])
+            start_row, start_col = sheet_issues['padding'][0], sheet_issues['padding'][2]
+            rows, cols = find_strip_cells(df.iloc[start_row:, start_col:])
+            if len(rows):
+                issues['strip_issues'] = True
+                sheet_issues['strip_cells'] = np.column_stack((rows + start_row, cols + start_col)).tolist()
             
         if issues['padding_found'] or issues['strip_issues']:
             issues['details'][name] = sheet_issues
             
     return issues if issues['padding_found'] or issues['strip_issues'] else None
 
+def _scan_sheet_values(rows, check_strip: bool) -> Tuple[int, int, List[str]]:
+    """
+    Single forward pass over the value rows of a sheet, as yielded by a read-only worksheet.
+    
+    Returns: (rows_to_delete, cols_to_delete, coordinates of the text cells to strip)
+    """
+    top, left = None, None
+    strip_cells = []
+    for row_idx, row in enumerate(rows, start=1):
+        first = next((col_idx for col_idx, value in enumerate(row) if value is not None), None)
+        if first is None:
+            continue
+        if top is None:
+            top = row_idx - 1
+        left = first if left is None else min(left, first)
+        if check_strip:
+            for col_idx, value in enumerate(row, start=1):
+                # Formulas come as strings starting with "=" when values_only is used
+                if isinstance(value, str) and not value.startswith("=") and STRIP_PATTERN.search(value):
+                    strip_cells.append(f"{get_column_letter(col_idx)}{row_idx}")
+    return top or 0, left or 0, strip_cells
+
 def check_xlsx_file(filename: str, check_padding: bool, check_strip: bool) -> Optional[Dict[str, Any]]:
     """
     Checks a single .xlsx file for padding and/or unstripped text.
+    The workbook is opened read-only and each sheet is streamed once, so memory does not grow with its size.
     
     Returns:
         A dictionary of issues found, or None if no issues found or file is not Excel/error occurred.
@@ -521,40 +1012,37 @@ def check_xlsx_file(filename: str, check_padding: bool, check_strip: bool) -> Op
         
     try:
         logger.info(filename)
-        wb = load_workbook(filename)
+        wb = load_workbook(filename, read_only=True)
     except Exception:
         logger.error(f"Could not load file {filename}. Skipping check.")
         return None
         
     issues = {'padding_found': False, 'strip_issues': False, 'details': {}}
     
-    for sheet_name in wb.sheetnames:
-        ws = wb[sheet_name]
-        sheet_issues = {'padding': (0, 0), 'strip_cells': []}
-        
-        # 1. Check Padding 
-        if check_padding:
-            rows_to_delete, cols_to_delete = get_padding_info_ws(ws)
-            if rows_to_delete > 0 or cols_to_delete > 0:
-                issues['padding_found'] = True
-                sheet_issues['padding'] = (rows_to_delete, cols_to_delete)
-        
-        # 2. Check Text Stripping 
-        if check_strip:
-            # We only need to check the remaining cells (i.e., skipping any padded area)
-            start_row = sheet_issues['padding'][0] + 1
-            start_col = sheet_issues['padding'][1] + 1
+    try:
+        for ws in wb.worksheets:
+            sheet_issues = {'padding': (0, 0, 0, 0), 'strip_cells': []}
+            # The stored dimension can be missing or wrong, read whatever the sheet contains
+            ws.reset_dimensions()
+            rows_to_delete, cols_to_delete, strip_cells = _scan_sheet_values(ws.iter_rows(values_only=True), check_strip)
             
-            for row in ws.iter_rows(min_row=start_row, min_col=start_col):
-                for cell in row:
-                    # Check for text (data_type 's') that starts or ends with space
-                    if cell.data_type == 's' and isinstance(cell.value, str):
-                        if cell.value.startswith(' ') or cell.value.endswith(' '):
-                            issues['strip_issues'] = True
-                            sheet_issues['strip_cells'].append(cell.coordinate)
+            # 1. Check Padding 
+            if check_padding and (rows_to_delete > 0 or cols_to_delete > 0):
+                issues['padding_found'] = True
+                sheet_issues['padding'] = (rows_to_delete, 0, cols_to_delete, 0)
             
-        if issues['padding_found'] or issues['strip_issues']:
-            issues['details'][sheet_name] = sheet_issues
+            # 2. Check Text Stripping 
+            if check_strip and strip_cells:
+                issues['strip_issues'] = True
+                sheet_issues['strip_cells'] = strip_cells
+                
+            if any(sheet_issues['padding']) or sheet_issues['strip_cells']:
+                issues['details'][ws.title] = sheet_issues
+    except Exception as e:
+        logger.error(f"Could not read file {filename}: {e}. Skipping check.")
+        return None
+    finally:
+        wb.close()
             
     return issues if issues['padding_found'] or issues['strip_issues'] else None
 
@@ -575,7 +1063,7 @@ def check_csv_file(filename: str, check_padding: bool, check_strip: bool, sep=",
         logger.error(f"Could not load file {filename}. Skipping check.")
         return None
         
-    issues = {'padding_found': False, 'strip_issues': False, 'details': {"only_sheet": {'padding': (0, 0), 'strip_cells': []}}}
+    issues = {'padding_found': False, 'strip_issues': False, 'details': {"only_sheet": {'padding': (0, 0, 0, 0), 'strip_cells': []}}}
     
     # 1. Check Padding
     if check_padding:
@@ -588,16 +1076,11 @@ def check_csv_file(filename: str, check_padding: bool, check_strip: bool, sep=",
     # 2. Check Text Stripping
     if check_strip:
         # We only need to check the remaining cells (i.e., skipping any padded area)
-        start_row = issues["details"]["only_sheet"]['padding'][0] + 1
-        start_col = issues["details"]["only_sheet"]['padding'][1] + 1
-        
-        for n, row in df.iloc[start_row:, start_col:].iterrows():
-            for m, cell in enumerate(row):
-                # Check for text (data_type 's') that starts or ends with space
-                if isinstance(cell, str):
-                    if cell.startswith(' ') or cell.endswith(' '):
-                        issues['strip_issues'] = True
-                        issues["details"]["only_sheet"]['strip_cells'].append([n + start_row, m + start_col])
+        start_row, start_col = issues["details"]["only_sheet"]['padding'][0], issues["details"]["only_sheet"]['padding'][2]
+        rows, cols = find_strip_cells(df.iloc[start_row:, start_col:])
+        if len(rows):
+            issues['strip_issues'] = True
+            issues["details"]["only_sheet"]['strip_cells'] = np.column_stack((rows + start_row, cols + start_col)).tolist()
         
     return issues if issues['padding_found'] or issues['strip_issues'] else None
 
@@ -1179,31 +1662,45 @@ def convert_file(file, out_format=None, destfol=None, destfbname=None,
         os.remove(file)
     logger.debug(f"Succesfully converted {file} into {outfile}")
 
-def detect_table(bool_df, point):
-    x, y = point
-    edges = np.array([[x, x], [y, y]])
-    nrows, ncols = bool_df.shape
-    maxs = ncols -1, nrows -1 
-    while True:
+# Number of cells searched at once for the next table seed
+SEED_SEARCH_CHUNK = 65536
+
+def _filled_counts(mask: np.ndarray) -> np.ndarray:
+    """2D prefix sums of a boolean mask, padded with a leading row and column of zeros."""
+    counts = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(mask, axis=0), axis=1, out=counts[1:, 1:])
+    return counts
+
+def _table_closure(counts: np.ndarray, point: Tuple[int, int]) -> np.ndarray:
+    """
+    Grows a rectangle from point (col, row) until the lines bordering it, within its span, are all empty,
+    i.e. the smallest such rectangle around point. Each border is tested in O(1) with the prefix sums counts.
+    Returns the edges as [[first col, last col], [first row, last row]], as detect_table.
+    """
+    nrows, ncols = counts.shape[0] - 1, counts.shape[1] - 1
+    def any_filled(r0, r1, c0, c1):
+        return counts[r1 + 1, c1 + 1] - counts[r0, c1 + 1] - counts[r1 + 1, c0] + counts[r0, c0] > 0
+    x0 = x1 = int(point[0])
+    y0 = y1 = int(point[1])
+    changed = True
+    while changed:
         changed = False
-        for n in range(2):  # x or y
-            for m in range(2):  # first or second edge
-                incr = 1 if m else -1
-                new_edges = edges.copy()
-                if 0 <= new_edges[n,m] + incr <=  maxs[n]:
-                    new_edges[n, m] += incr
-                else:
-                    continue
-                if n:
-                    non_empty = bool_df.iloc[new_edges[1,m], new_edges[0,0]:new_edges[0,1] + 1].any()
-                else:
-                    non_empty = bool_df.iloc[new_edges[1,0]:new_edges[1,1]+1, new_edges[0,m]].any()
-                if non_empty:
-                    changed = True
-                    edges = new_edges
-        if not changed:
-            break
-    return edges
+        while x0 > 0 and any_filled(y0, y1, x0 - 1, x0 - 1):
+            x0, changed = x0 - 1, True
+        while x1 < ncols - 1 and any_filled(y0, y1, x1 + 1, x1 + 1):
+            x1, changed = x1 + 1, True
+        while y0 > 0 and any_filled(y0 - 1, y0 - 1, x0, x1):
+            y0, changed = y0 - 1, True
+        while y1 < nrows - 1 and any_filled(y1 + 1, y1 + 1, x0, x1):
+            y1, changed = y1 + 1, True
+    return np.array([[x0, x1], [y0, y1]])
+
+def detect_table(bool_df, point):
+    """
+    Returns the edges [[first col, last col], [first row, last row]] of the table around point (col, row)
+    of bool_df (True for filled cells): the smallest rectangle whose bordering lines are empty.
+    """
+    return _table_closure(_filled_counts(np.asarray(bool_df, dtype=bool)), point)
             
 def slice_table(df, edges):
     return df.iloc[edges[1,0]: edges[1,1] + 1, edges[0,0]: edges[0,1] + 1].copy()
@@ -1231,15 +1728,34 @@ def point_in_any_table(edges_list, point, padding=False, nrows=None, ncols=None)
     return False
 
 def detect_table_edges(bool_df):
-    nrows, ncols = bool_df.shape
-    coords = product(range(ncols), range(nrows))
-    seen = set()
+    """
+    Returns the edges of all the tables of bool_df (True for filled cells), see detect_table.
+    Seeds are the filled cells taken column by column, skipping those within one cell of a table
+    already found. Cells covered by tables are tracked in a mask stored column by column, in which
+    the next seed is searched by chunks, so the whole sheet is scanned about once.
+    """
+    mask = np.asarray(bool_df, dtype=bool)
+    nrows, ncols = mask.shape
+    counts = _filled_counts(mask)
+    # Transposed, so that the flat index follows the column by column order of the seeds
+    filled = np.ascontiguousarray(mask.T).ravel()
+    covered = np.zeros((ncols, nrows), dtype=bool)
+    covered_flat = covered.ravel()
     table_edges = []
-    for point in coords:
-        if bool_df.iloc[point[1], point[0]] and (point not in seen) and not point_in_any_table(table_edges, point, padding=True, nrows=nrows, ncols=ncols):
-            new_table_edges = detect_table(bool_df, point)
-            table_edges.append(new_table_edges)
-        seen.add(point)
+    pos = 0
+    while pos < filled.size:
+        stop = min(pos + SEED_SEARCH_CHUNK, filled.size)
+        candidates = filled[pos:stop] & ~covered_flat[pos:stop]
+        if not candidates.any():
+            pos = stop
+            continue
+        pos += int(candidates.argmax())
+        col, row = divmod(pos, nrows)
+        edges = _table_closure(counts, (col, row))
+        table_edges.append(edges)
+        # Same padding as point_in_table(..., padding=True)
+        covered[max(edges[0, 0] - 1, 0):edges[0, 1] + 2, max(edges[1, 0] - 1, 0):edges[1, 1] + 2] = True
+        pos += 1
     return table_edges
 
 def get_tables_df(df):
@@ -1398,9 +1914,9 @@ def process_command(args):
         unpad = False if args.strip_only else True
         strip_text = False if args.unpad_only else True
         if os.path.isfile(args.source):
-            unpad_strip_file(args.source, dest, ext, unpad, strip_text)
+            unpad_strip_file(args.source, dest, ext, unpad, strip_text, xlsx_engine=args.xlsx_engine)
         elif os.path.isdir(args.source):
-            unpad_strip_recursively(args.source, dest, unpad, strip_text, in_formats=in_formats)
+            unpad_strip_recursively(args.source, dest, unpad, strip_text, in_formats=in_formats, xlsx_engine=args.xlsx_engine)
     else:
         out_format = helpers.harmonize_ext(args.out_format) if args.out_format else None
         if args.vsplit_tables:
@@ -1516,6 +2032,14 @@ def cli():
         dest='in_formats',
         help=f'The extension(s) to process if the source is a folder. Provide a comma separated list (e.g. "csv,tsv") either without using space or wrapping it in quotation marks.  If nothing is provided, it will process {TABULAR_EXTENSIONS}.'
     )
+    
+    parser_process.add_argument(
+        '--xlsx-engine',
+        choices=XLSX_ENGINES,
+        default="openpyxl",
+        dest='xlsx_engine',
+        help='How xlsx files are unpadded and/or stripped: "openpyxl" loads the whole workbook, "xml" rewrites the sheet XML directly, which is much faster and lighter on large workbooks and keeps charts and images.'
+    )
 
     # 2. Mutually Exclusive Group for output location (Required for PROCESS)
     location_group_process = parser_process.add_mutually_exclusive_group(required=True)
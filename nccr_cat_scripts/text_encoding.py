@@ -6,13 +6,24 @@ Created on Tue Jan  6 11:36:28 2026
 @author: nr
 """
 import argparse
+import codecs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
 import importlib
+import json
+from itertools import repeat
 import logging
+import mmap
 import os
 import re
-import shutil as sh
+import sqlite3
 import sys
+import time
+
+
+import numpy as np
 from nccr_cat_scripts import helpers
+from nccr_cat_scripts.helpers import CHUNK_SIZE
 
 
 # --- Logger Setup ---
@@ -31,50 +42,302 @@ class EncodingMismatchError(ValueError):
     """Raised when the detected file encoding does not match the expected one."""
     pass
 
-def decode_scientific(file_path, enc=None):
-    # Order of probability for European lab equipment
-    encodings = [enc] if enc else ['utf-8', 'latin-1', 'cp1252', 'utf-16']
-    
-    # REGEX EXPLANATION:
-    # \u0000-\u007F: Basic ASCII
-    # \u0080-\u00FF: Latin-1 Supplement (µ, °, é, etc.)
-    # \u0370-\u03FF: Greek and Coptic characters
-    # \s: Whitespace (newlines, tabs)
-    valid_pattern = re.compile(r'^[\u0000-\u007F\u0080-\u00FF\u0370-\u03FF\u2000-\u206F\u2100-\u214F\u2200-\u22FF\s]*$')
+CACHE_FILENAME = ".text_enc_cache.sqlite"
+DEFAULT_CACHE_ENTRIES = 1000000
+REPORT_FIELDS = ('path', 'dest', 'encoding', 'action', 'bytes_read', 'bytes_written', 'detect_s', 'write_s')
+LINK_VERBS = {'copy': 'copied', 'hardlink': 'hard-linked', 'reflink': 'reflinked', 'symlink': 'symlinked'}
+
+# REGEX EXPLANATION:
+# \u0000-\u007F: Basic ASCII
+# \u0080-\u00FF: Latin-1 Supplement (µ, °, é, etc.)
+# \u0370-\u03FF: Greek and Coptic characters
+# \s: Whitespace (newlines, tabs)
+VALID_PATTERN = re.compile(r'^[\u0000-\u007F\u0080-\u00FF\u0370-\u03FF\u2000-\u206F\u2100-\u214F\u2200-\u22FF\s]*$')
+
+
+def _get_incremental_decoder(encoding):
+    try:
+        return codecs.getincrementaldecoder(encoding)()
+    except LookupError:
+        raise LookupError("Encoding lookup error, maybe a typo?") from None # we use our own message
 
+
+def _is_scientific_utf8_block(data):
+    """
+    Vectorized check that a uint8 array of complete UTF-8 sequences only encodes characters
+    in the ranges of VALID_PATTERN (leaving out the few exotic Unicode whitespaces matched by \\s).
+    """
+    high = data >= 0x80
+    if not high.any():
+        return True
+    cont = (data & 0xC0) == 0x80
+    # Lead bytes of the 2-byte sequences we accept: C2-C3 (U+0080-U+00FF), CD-CF (U+0340-U+03FF)
+    lead2 = (data == 0xC2) | (data == 0xC3) | ((data >= 0xCD) & (data <= 0xCF))
+    # Lead byte of the 3-byte sequences we accept: E2 (U+2000-U+2FFF)
+    lead3 = data == 0xE2
+    if (high & ~(cont | lead2 | lead3)).any():
+        return False
+    idx2, idx3 = np.flatnonzero(lead2), np.flatnonzero(lead3)
+    if (idx2.size and idx2[-1] + 1 >= data.size) or (idx3.size and idx3[-1] + 2 >= data.size):
+        return False
+    # Continuation bytes must be exactly the ones following the lead bytes
+    expected = np.zeros(data.size, dtype=bool)
+    expected[idx2 + 1] = True
+    expected[idx3 + 1] = True
+    expected[idx3 + 2] = True
+    if not np.array_equal(expected, cont):
+        return False
+    # CD covers U+0340-U+037F, of which only U+0370-U+037F is Greek
+    if (data[idx2[data[idx2] == 0xCD] + 1] < 0xB0).any():
+        return False
+    # E2 covers U+2000-U+2FFF, of which we accept U+2000-U+206F, U+2100-U+214F and U+2200-U+22FF
+    b1, b2 = data[idx3 + 1], data[idx3 + 2]
+    allowed = ((b1 == 0x80) | ((b1 == 0x81) & (b2 <= 0xAF)) | (b1 == 0x84) | ((b1 == 0x85) & (b2 <= 0x8F))
+               | ((b1 >= 0x88) & (b1 <= 0x8B)))
+    return bool(allowed.all())
+
+
+def is_scientific_utf8(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Fast path of decode_scientific: scans the raw bytes with NumPy to prove that a file is ASCII,
+    or UTF-8 within the scientific character set, without building any decoded string.
+    A False result is not conclusive, it only means that the full detection is needed.
+    """
+    # 2 extra bytes to carry an incomplete UTF-8 sequence over to the next chunk
+    buffer = bytearray(chunk_size + 2)
+    view = memoryview(buffer)
+    carry = 0
     with open(file_path, 'rb') as f:
-        raw_data = f.read()
+        while n_read := f.readinto(view[carry:carry + chunk_size]):
+            size = carry + n_read
+            data = np.frombuffer(buffer, dtype=np.uint8, count=size)
+            if data[-1] >= 0xC0:
+                carry = 1
+            elif size >= 2 and data[-2] >= 0xE0:
+                carry = 2
+            else:
+                carry = 0
+            if not _is_scientific_utf8_block(data[:size - carry]):
+                return False
+            del data # release the export of buffer before writing into it
+            buffer[:carry] = buffer[size - carry:size]
+    # Leftover bytes at the end of the file are a truncated sequence
+    return carry == 0
+
 
-    for encoding in encodings:
+def _scientific_byte_table(encoding):
+    """For a single-byte encoding, marks the bytes that decode to a character matched by VALID_PATTERN."""
+    allowed = np.zeros(256, dtype=bool)
+    for byte in range(256):
         try:
-            # Attempt to decode
-            decoded_text = raw_data.decode(encoding)
-            
+            allowed[byte] = bool(VALID_PATTERN.match(bytes([byte]).decode(encoding)))
+        except UnicodeDecodeError:
+            pass
+    return allowed
+
+
+SINGLE_BYTE_TABLES = {encoding: _scientific_byte_table(encoding) for encoding in ('latin-1', 'cp1252')}
+
+
+class _StreamCheck:
+    """Incrementally decodes a stream and checks it against VALID_PATTERN, remembering the first failure."""
+    def __init__(self, encoding):
+        self.decoder = _get_incremental_decoder(encoding)
+        self.valid = True
+
+    def feed(self, chunk, final=False, ascii_only=False):
+        if not self.valid:
+            return
+        try:
+            decoded_text = self.decoder.decode(chunk, final=final)
+        except UnicodeError:
+            self.valid = False
+            return
+        # Plain ASCII always fits, no need for the regex
+        if not ascii_only and not VALID_PATTERN.match(decoded_text):
+            self.valid = False
+
+
+def classify_encoding(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Scores all candidate encodings in a single read of the file, from its byte histogram,
+    its BOM and the position of its null bytes:
+    - UTF-8 (or UTF-8 with BOM) must decode and fit the scientific character set,
+    - latin-1 and cp1252 must map every byte present to the scientific character set,
+      and latin-1 is penalized for the C1 control bytes (0x80-0x9F) that cp1252 uses for quotes, dashes, etc.,
+    - UTF-16 is only considered with a BOM or with null bytes concentrated on even or odd positions.
+    Null bytes penalize all the 8-bit encodings. A BOM the whole file decodes after wins over the scores.
+
+    Returns:
+        (best encoding or None if no candidate fits, {encoding: score between 0 and 1, or None if excluded})
+    """
+    hist = np.zeros(256, dtype=np.int64)
+    zeros_at = [0, 0] # null bytes at even and odd offsets
+    checks = {'utf-8': _StreamCheck('utf-8')}
+    offset = 0
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            data = np.frombuffer(chunk, dtype=np.uint8)
+            if offset == 0:
+                # The first chunk decides which variants of UTF-8/UTF-16 are worth decoding
+                if chunk.startswith(codecs.BOM_UTF8):
+                    checks = {'utf-8-sig': _StreamCheck('utf-8-sig')}
+                if chunk.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+                    checks['utf-16'] = _StreamCheck('utf-16')
+                elif data.size >= 2:
+                    even, odd = np.count_nonzero(data[0::2] == 0), np.count_nonzero(data[1::2] == 0)
+                    if odd > 2 * even and odd > data.size // 8:
+                        checks['utf-16-le'] = _StreamCheck('utf-16-le')
+                    elif even > 2 * odd and even > data.size // 8:
+                        checks['utf-16-be'] = _StreamCheck('utf-16-be')
+            hist += np.bincount(data, minlength=256)
+            zeros_at[offset % 2] += np.count_nonzero(data[0::2] == 0)
+            zeros_at[1 - offset % 2] += np.count_nonzero(data[1::2] == 0)
+            chunk_is_ascii = not (data >= 0x80).any()
+            for encoding, check in checks.items():
+                # ASCII bytes can still decode to anything in UTF-16
+                check.feed(chunk, ascii_only=chunk_is_ascii and encoding.startswith('utf-8'))
+            offset += len(chunk)
+    for check in checks.values():
+        check.feed(b'', final=True, ascii_only=True)
+
+    n_bytes = max(offset, 1)
+    n_nulls = hist[0]
+    scores = {}
+    for encoding, check in checks.items():
+        if encoding.startswith('utf-8'):
+            scores[encoding] = float(1 - n_nulls / n_bytes) if check.valid else None
+        else:
+            # Share of the code units with a null byte where ASCII/Latin-1 text in UTF-16 puts it
+            units = max(offset // 2, 1)
+            nulls = zeros_at[1] if encoding == 'utf-16-le' else zeros_at[0] if encoding == 'utf-16-be' else units
+            scores[encoding] = float(min(nulls / units, 1)) if check.valid else None
+    for encoding, allowed in SINGLE_BYTE_TABLES.items():
+        if hist[~allowed].any():
+            scores[encoding] = None
+            continue
+        suspicious = n_nulls + (hist[0x80:0xA0].sum() if encoding == 'latin-1' else 0)
+        scores[encoding] = float(1 - suspicious / n_bytes)
+
+    # A BOM is stronger evidence than the histogram: the bytes of UTF-16 text without nulls can all be valid latin-1
+    for encoding in ('utf-8-sig', 'utf-16'):
+        if scores.get(encoding) is not None:
+            return encoding, scores
+    # Ties are broken by the usual order of probability
+    order = ['utf-8-sig', 'utf-8', 'latin-1', 'cp1252', 'utf-16', 'utf-16-le', 'utf-16-be']
+    ranked = sorted((encoding for encoding in scores if scores[encoding] is not None),
+                    key=lambda encoding: (-scores[encoding], order.index(encoding)))
+    return (ranked[0] if ranked else None), scores
+
+
+def decode_scientific(file_path, enc=None, chunk_size=CHUNK_SIZE):
+    """
+    Detects the encoding of a text file, streaming it in chunks so that memory stays bounded.
+    Without enc, ASCII/UTF-8 files are recognized by a byte scan (is_scientific_utf8), and the others
+    by classify_encoding. With enc, the file is decoded incrementally to check that it fits the scientific
+    character set, and EncodingMismatchError is raised as soon as a chunk does not.
+
+    Returns:
+        the encoding to read the file with.
+    """
+    encoding = enc if enc else 'utf-8'
+    decoder = _get_incremental_decoder(encoding)
+
+    if codecs.lookup(encoding).name == 'utf-8' and is_scientific_utf8(file_path, chunk_size=chunk_size):
+        logger.debug(f"Byte scan shows this file is ASCII or UTF-8: {file_path}")
+        return 'utf-8'
+
+    if not enc:
+        encoding, scores = classify_encoding(file_path, chunk_size=chunk_size)
+        logger.debug(f"Encoding scores for {file_path}: {scores}")
+        if encoding is None:
+            raise ValueError(f"Could not find a valid encoding that matches the expected character set for {file_path}.")
+        logger.debug(f"Classified this file as {encoding}: {file_path}")
+        return encoding
+
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            try:
+                decoded_text = decoder.decode(chunk, final=not chunk)
+            except UnicodeError: # e.g. UnicodeDecodeError, or a UTF-16 stream without BOM
+                logger.debug(f"Could not decode this file with {encoding}: {file_path}")
+                break
             # Verify if the content fits our "Scientific/European" universe
-            if valid_pattern.match(decoded_text):
-                logger.debug(f"Successfully decoded this file with {encoding}: {file_path}")
-                return encoding, decoded_text
-            elif enc:
+            if not VALID_PATTERN.match(decoded_text):
                 raise EncodingMismatchError(f"This file is not encoded with {encoding}: {file_path}")
-            else:
-                logger.debug(f"Skipping {encoding}: Contains characters outside scientific range.")
-        except UnicodeDecodeError:
-            logger.debug(f"Could not decode this file with {encoding}: {file_path}")
-        except LookupError:
-            raise LookupError("Encoding lookup error, maybe a typo?") from None # we use our own message
-            
+            if not chunk:
+                logger.debug(f"Successfully decoded this file with {encoding}: {file_path}")
+                return encoding
+
     raise ValueError(f"Could not find a valid encoding that matches the expected character set for {file_path}.")
 
 
-def process_file(path, enc=None, inplace=None, dest=None, check_dest=True):
+def iter_decoded_chunks(file_path, encoding, chunk_size=CHUNK_SIZE):
+    """Yields the text of file_path decoded with encoding, one chunk at a time."""
+    decoder = _get_incremental_decoder(encoding)
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def transcode_inplace(path, encoding, chunk_size=CHUNK_SIZE):
+    """
+    Converts path from encoding to UTF-8 without ever truncating the original: the source is memory-mapped
+    and transcoded chunk by chunk through a bounded write buffer into a temporary file in the same directory,
+    which is fsynced and then atomically renamed over the original (see helpers.replacing). Peak memory does
+    not depend on the file size, and after a crash the original is either untouched or fully converted.
+    """
+    with helpers.replacing(path, mode_from=path, durable=True, buffering=chunk_size) as out, open(path, 'rb') as src:
+        decoder = _get_incremental_decoder(encoding)
+        # Empty files cannot be mapped (and have nothing to convert)
+        if os.fstat(src.fileno()).st_size:
+            with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, len(mapped), chunk_size):
+                    out.write(decoder.decode(mapped[start:start + chunk_size]).encode('utf-8'))
+        out.write(decoder.decode(b'', final=True).encode('utf-8'))
+
+
+def write_utf8(path, dest, encoding, chunk_size=CHUNK_SIZE):
+    """
+    Transcodes path from encoding into dest (UTF-8) chunk by chunk.
+    If dest is path, the conversion is done by transcode_inplace.
+    """
+    if os.path.abspath(path) == os.path.abspath(dest):
+        transcode_inplace(path, encoding, chunk_size=chunk_size)
+        return
+    if os.path.lexists(dest):
+        os.remove(dest) # it may be a link to path left by a previous run with --link-mode
+    with open(dest, 'wb') as f:
+        for decoded_text in iter_decoded_chunks(path, encoding, chunk_size=chunk_size):
+            f.write(decoded_text.encode('utf-8'))
+
+
+def _process_file(path, enc=None, inplace=None, dest=None, check_dest=True, link_mode='copy'):
+    """
+    Does the work of process_file without logging the outcome, so that it can run in a worker process.
+
+    Returns:
+        a dict describing what was done to the file, with the message to log and its level.
+    """
+    result = {'path': path, 'dest': dest, 'encoding': None, 'action': 'failed', 'level': logging.ERROR,
+              'bytes_read': 0, 'bytes_written': 0, 'detect_s': 0.0, 'write_s': 0.0}
+    start = time.perf_counter()
     try:
-        encoding, decoded_text = decode_scientific(path, enc=enc)
+        result['bytes_read'] = os.path.getsize(path)
+        encoding = decode_scientific(path, enc=enc)
     except EncodingMismatchError as e:
-        logger.error(e)
+        result['message'] = str(e)
+        return result
     except ValueError as e:
-        logger.error(e)
+        result['message'] = str(e)
+        return result
     except Exception as e:
-        logger.error(f"Unknown error encountered for {path}. Error: {e}")
+        result['message'] = f"Unknown error encountered for {path}. Error: {e}"
+        return result
+    finally:
+        result['detect_s'] = time.perf_counter() - start
     if inplace:
         dest = path
     elif dest is None:
@@ -84,27 +347,188 @@ def process_file(path, enc=None, inplace=None, dest=None, check_dest=True):
         filename = os.path.basename(path)
         base, ext = os.path.splitext(filename) # NB ext has a . (e.g. .txt)
         dest = os.path.join(dest, f"{base}_utf8{ext}")
-    if encoding == "utf-8":
-        if inplace:
-            logger.info(f"File was already in UTF-8: {dest}")
+    result.update(dest=dest, encoding=encoding)
+    start = time.perf_counter()
+    try:
+        if encoding == "utf-8":
+            if inplace:
+                result.update(action='already_utf8', level=logging.INFO,
+                              message=f"File was already in UTF-8: {dest}")
+            else:
+                method = helpers.link_or_copy(path, dest, mode=link_mode)
+                result.update(action='already_utf8', level=logging.INFO,
+                              message=f"File was already in UTF-8, {LINK_VERBS[method]} from {path} to {dest}")
+                if method == 'copy':
+                    result['bytes_written'] = result['bytes_read']
         else:
-            sh.copy2(path, dest)
-            logger.info(f"File was already in UTF-8, copied from {path} to {dest}")
-    else:
-        with open(dest, 'w', encoding='utf-8') as f:
-            f.write(decoded_text)
-        logger.info(f"Converted from {encoding} to UTF-8 {dest}" if inplace else f"Converted {path} from {encoding} into {dest} (UTF-8)")
+            write_utf8(path, dest, encoding)
+            result.update(action='converted', level=logging.INFO, bytes_written=os.path.getsize(dest),
+                          message=f"Converted from {encoding} to UTF-8 {dest}" if inplace else f"Converted {path} from {encoding} into {dest} (UTF-8)")
+    except Exception as e:
+        result['message'] = f"Could not write {dest}. Error: {e}"
+    result['write_s'] = time.perf_counter() - start
+    return result
+
+
+def _copy_file(path, dest, link_mode='copy'):
+    """Copies (or links) a file that does not need conversion, returning a result dict like _process_file."""
+    result = {'path': path, 'dest': dest, 'encoding': None, 'action': 'copied', 'level': logging.DEBUG,
+              'bytes_read': 0, 'bytes_written': 0, 'detect_s': 0.0, 'write_s': 0.0}
+    start = time.perf_counter()
+    try:
+        method = helpers.link_or_copy(path, dest, mode=link_mode)
+        result['message'] = f"{LINK_VERBS[method].capitalize()} {path} to {dest}"
+        if method == 'copy':
+            result['bytes_read'] = result['bytes_written'] = os.path.getsize(dest)
+    except Exception as e:
+        result.update(action='failed', level=logging.ERROR, message=f"Could not copy {path} to {dest}. Error: {e}")
+    result['write_s'] = time.perf_counter() - start
+    return result
+
+
+def _report_record(result):
+    """The line written to the --report file for a result of _process_file or _copy_file."""
+    record = {field: result[field] for field in REPORT_FIELDS}
+    if result['action'] == 'failed':
+        record['error'] = result['message']
+    return record
+
+
+def _summarize(results, elapsed):
+    counts = {action: 0 for action in ('converted', 'already_utf8', 'copied', 'cached', 'failed')}
+    for result in results:
+        counts[result['action']] += 1
+    mb_read = sum(result['bytes_read'] for result in results) / 1e6
+    mb_written = sum(result['bytes_written'] for result in results) / 1e6
+    elapsed = max(elapsed, 1e-9)
+    return {'counts': counts, 'files': len(results), 'elapsed_s': elapsed, 'files_per_s': len(results) / elapsed,
+            'mb_read': mb_read, 'mb_written': mb_written, 'mb_per_s': mb_read / elapsed,
+            'detect_s': sum(result['detect_s'] for result in results),
+            'write_s': sum(result['write_s'] for result in results)}
+
+
+def _log_summary(summary):
+    counts = summary['counts']
+    logger.info(f"--- Summary: {counts['converted']} converted, {counts['already_utf8']} already in UTF-8, "
+                f"{counts['copied']} copied, {counts['cached']} unchanged since last run, {counts['failed']} failed ---")
+    logger.info(f"--- Throughput: {summary['files']} files in {summary['elapsed_s']:.2f} s "
+                f"({summary['files_per_s']:.1f} files/s, {summary['mb_per_s']:.2f} MB/s read) ---")
+
+
+def _write_report_line(report_file, record):
+    report_file.write(json.dumps(record) + "\n")
+
+
+class EncodingCache:
+    """
+    SQLite record of the files handled by previous runs, keyed by their path relative to the processed root.
+    An entry is only reused if the file still has the same fingerprint (size, mtime_ns and, optionally,
+    SHA-256 of the content) and was handled by the same kind of task ('convert' or 'copy') with the same
+    target encoding, for conversions (copies do not depend on it). Entries are evicted least-recently-used
+    first beyond max_entries.
+    """
+
+    def __init__(self, db_path, max_entries=DEFAULT_CACHE_ENTRIES, hash_content=False):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hash_content = hash_content
+        self.pending = 0
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+            "digest TEXT, encoding TEXT, converted INTEGER, kind TEXT, enc TEXT, last_used REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used)")
+
+    def fingerprint(self, path):
+        stat = os.stat(path)
+        digest = None
+        if self.hash_content:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+        return stat.st_size, stat.st_mtime_ns, digest
+
+    def lookup(self, key, path, kind, enc=None):
+        """
+        Returns the cached (encoding, converted) of path if its fingerprint did not change and it was
+        handled by the same kind of task with the same enc, None otherwise.
+        """
+        enc = None if kind == 'copy' else enc
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, digest, encoding, converted, kind, enc FROM files WHERE path = ?", (key,)
+        ).fetchone()
+        if row is None or tuple(row[5:]) != (kind, enc) or tuple(row[:3]) != self.fingerprint(path):
+            return None
+        self.conn.execute("UPDATE files SET last_used = ? WHERE path = ?", (time.time(), key))
+        return row[3], bool(row[4])
+
+    def store(self, key, path, encoding, converted, kind, enc=None):
+        """Records path as it is on disk now, i.e. after any in-place conversion, along with the task that handled it."""
+        enc = None if kind == 'copy' else enc
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, *self.fingerprint(path), encoding, int(converted), kind, enc, time.time())
+        )
+        self.pending += 1
+        if self.pending >= 1000:
+            self.conn.commit()
+            self.pending = 0
+
+    def close(self):
+        n_entries = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        if n_entries > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM files WHERE path IN (SELECT path FROM files ORDER BY last_used LIMIT ?)",
+                (n_entries - self.max_entries,)
+            )
+        self.conn.commit()
+        self.conn.close()
+
+
+def process_file(path, enc=None, inplace=None, dest=None, check_dest=True, link_mode='copy', report=None):
+    start = time.perf_counter()
+    result = _process_file(path, enc=enc, inplace=inplace, dest=dest, check_dest=check_dest, link_mode=link_mode)
+    logger.log(result['level'], result['message'])
+    if report:
+        with open(report, 'w', encoding='utf-8') as report_file:
+            _write_report_line(report_file, _report_record(result))
+            _write_report_line(report_file, {'summary': _summarize([result], time.perf_counter() - start)})
+    return result
     
             
-def process_recursively(path, formats=None, enc=None, inplace=False, dest=None):
+def process_recursively(path, formats=None, enc=None, inplace=False, dest=None, jobs=1,
+                        cache=False, cache_hash=False, cache_size=DEFAULT_CACHE_ENTRIES, link_mode='copy',
+                        report=None):
+    """
+    Converts all files ending with one of formats under path, and copies the others to dest (unless inplace).
+    With jobs > 1, detection and conversion run in a process pool and plain copies in a thread pool.
+    The tree is walked in sorted order and results are logged in that order, whatever the number of jobs.
+    With cache, files that did not change since a previous run (see EncodingCache) are skipped.
+    link_mode (see helpers.LINK_MODES) sets how files that are already UTF-8 or not in formats reach dest.
+    With report, one JSON line per file (see REPORT_FIELDS) and a final summary line are written to that path.
+    """
+    start = time.perf_counter()
     if dest is None and not inplace:
         dest = f"{path[:-1] if path.endswith(os.sep) else path}_utf8"
         logger.info(f"You neither specified a destination nor used --inplace. Using {dest} as destination")
     if formats is None:
         raise ValueError("")
-    for folder, subfolder, files in os.walk(path):
-        for file in files:
+    encoding_cache = None
+    if cache:
+        cache_root = path if inplace else dest
+        os.makedirs(cache_root, exist_ok=True)
+        encoding_cache = EncodingCache(os.path.join(cache_root, CACHE_FILENAME), max_entries=cache_size,
+                                       hash_content=cache_hash)
+    tasks = [] # (kind, fpath, outfpath) with kind in 'convert', 'copy', 'cached'
+    for folder, subfolders, files in os.walk(path):
+        subfolders.sort()
+        for file in sorted(files):
             fpath = os.path.join(folder, file)
+            if os.path.normpath(folder) == os.path.normpath(path) and file.startswith(CACHE_FILENAME):
+                continue # the cache itself (and its journal), in --inplace mode
             if inplace:
                 outfpath = fpath
             else:
@@ -114,9 +538,70 @@ def process_recursively(path, formats=None, enc=None, inplace=False, dest=None):
                 os.makedirs(out_dir, exist_ok=True)
                 outfpath = os.path.join(out_dir, file)
             if file.endswith(formats):
-                process_file(fpath, enc=enc,inplace=inplace, dest=outfpath, check_dest=False)
+                kind = 'convert'
             elif not inplace:
-                sh.copy2(fpath, outfpath)
+                kind = 'copy'
+            else:
+                continue
+            if encoding_cache and (inplace or os.path.exists(outfpath)) \
+                    and encoding_cache.lookup(os.path.relpath(fpath, path), fpath, kind, enc):
+                kind = 'cached'
+            tasks.append((kind, fpath, outfpath))
+
+    results = []
+    report_file = open(report, 'w', encoding='utf-8') if report else None
+    def handle(result, kind):
+        logger.log(result['level'], result['message'])
+        results.append(result)
+        if report_file:
+            _write_report_line(report_file, _report_record(result))
+        if encoding_cache and result['action'] in ('converted', 'already_utf8', 'copied'):
+            encoding_cache.store(os.path.relpath(result['path'], path), result['dest'] if inplace else result['path'],
+                                 result['encoding'], result['action'] == 'converted', kind, enc)
+
+    def cached(fpath, outfpath):
+        return {'path': fpath, 'dest': outfpath, 'encoding': None, 'action': 'cached', 'level': logging.DEBUG,
+                'message': f"Unchanged since last run, skipping {fpath}",
+                'bytes_read': 0, 'bytes_written': 0, 'detect_s': 0.0, 'write_s': 0.0}
+
+    to_convert = [(fpath, outfpath) for kind, fpath, outfpath in tasks if kind == 'convert']
+    to_copy = [(fpath, outfpath) for kind, fpath, outfpath in tasks if kind == 'copy']
+    try:
+        if jobs > 1:
+            chunksize = max(1, min(64, len(to_convert) // (4 * jobs)))
+            with ProcessPoolExecutor(max_workers=jobs, initializer=helpers.init_worker, initargs=(logger.name, logger.level)) as procs, \
+                 ThreadPoolExecutor(max_workers=jobs) as threads:
+                # Arguments are passed positionally, following the signature of _process_file
+                converted = procs.map(_process_file, [t[0] for t in to_convert], repeat(enc), repeat(inplace),
+                                      [t[1] for t in to_convert], repeat(False), repeat(link_mode),
+                                      chunksize=chunksize)
+                copied = threads.map(_copy_file, [t[0] for t in to_copy], [t[1] for t in to_copy], repeat(link_mode))
+                # Both maps yield in submission order, so interleaving them follows the walk order
+                for kind, fpath, outfpath in tasks:
+                    if kind == 'convert':
+                        handle(next(converted), kind)
+                    elif kind == 'copy':
+                        handle(next(copied), kind)
+                    else:
+                        handle(cached(fpath, outfpath), kind)
+        else:
+            for kind, fpath, outfpath in tasks:
+                if kind == 'convert':
+                    handle(_process_file(fpath, enc=enc, inplace=inplace, dest=outfpath, check_dest=False,
+                                         link_mode=link_mode), kind)
+                elif kind == 'copy':
+                    handle(_copy_file(fpath, outfpath, link_mode=link_mode), kind)
+                else:
+                    handle(cached(fpath, outfpath), kind)
+    finally:
+        if encoding_cache:
+            encoding_cache.close()
+        summary = _summarize(results, time.perf_counter() - start)
+        if report_file:
+            _write_report_line(report_file, {'summary': summary})
+            report_file.close()
+    _log_summary(summary)
+    return results
                 
                 
 def run_conversion(args):
@@ -138,14 +623,22 @@ def run_conversion(args):
             formats=format_tuple,
             enc=args.enc,
             inplace=args.inplace,
-            dest=args.destination
+            dest=args.destination,
+            jobs=args.jobs,
+            cache=args.cache,
+            cache_hash=args.cache_hash,
+            cache_size=args.cache_size,
+            link_mode=args.link_mode,
+            report=args.report
         )
     elif os.path.isfile(args.path):
         process_file(
             path=args.path,
             enc=args.enc,
             inplace=args.inplace,
-            dest=args.destination
+            dest=args.destination,
+            link_mode=args.link_mode,
+            report=args.report
         )
     else:
         logger.error(f"The path '{args.path}' does not exist.")
@@ -177,6 +670,12 @@ def cli():
     parser_convert.add_argument('--inplace', action='store_true', help="Overwrite original files")
     parser_convert.add_argument('--destination', '--dest', '-d', type=str, help="Destination path/directory")
     parser_convert.add_argument('--enc', type=str, help="Expected encoding. Use it if you know it, it will make the conversion faster and more robust.")
+    parser_convert.add_argument('--jobs', '-j', type=int, default=1, help="Number of files to process in parallel when converting a directory (default: 1).")
+    parser_convert.add_argument('--cache', action='store_true', help=f"Remember the detected encodings in {CACHE_FILENAME} (in the destination, or in the source with --inplace) and skip unchanged files on later runs.")
+    parser_convert.add_argument('--cache-hash', action='store_true', help="With --cache, also compare a SHA-256 of the content, not only size and modification time.")
+    parser_convert.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_ENTRIES, help=f"Maximum number of files remembered by --cache (default: {DEFAULT_CACHE_ENTRIES}).")
+    parser_convert.add_argument('--link-mode', choices=helpers.LINK_MODES, default='copy', help="How to bring files that need no conversion to the destination (default: copy). Unsupported methods fall back to cheaper-to-support ones, down to a plain copy. Beware that with hardlink or symlink, editing the output also edits the source.")
+    parser_convert.add_argument('--report', type=str, help="Write a JSON line per file (encoding, action, bytes read/written, time spent detecting/writing) to this path, ending with a summary line.")
     parser_convert.add_argument('--formats', '--format', '-f', type=str, default=".txt", help="Comma-separated list of extensions to process (e.g. 'txt,csv'). You can either use no space or wrap the list in quotation marks.")
 
     if importlib.util.find_spec("argcomplete"):
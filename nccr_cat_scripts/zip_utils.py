@@ -6,18 +6,32 @@ Created on Thu Nov 20 14:53:00 2025
 @author: nr
 """
 import argparse
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+import copy
+import csv
+import hashlib
 import importlib
 import logging
 import os
 import shutil
+import struct
+import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
+import time
 import zipfile as zf
+import zlib
 from typing import Dict, Optional
 
 
+import numpy as np
 import rarfile
+from nccr_cat_scripts import helpers
+from nccr_cat_scripts.helpers import CHUNK_SIZE
 
 # --- Logger Setup (Ensures clean output without '__main__') ---
 logger = logging.getLogger(__name__)
@@ -34,234 +48,507 @@ logger.addHandler(handler)
 
 # Files and folders to strictly ignore during zipping/copying process
 SYSTEM_FILES_TO_IGNORE = ('.DS_Store', '__MACOSX', "Thumbs.db")
+# Nested zips larger than this are cleaned in temporary files rather than in memory
+DEFAULT_MAX_IN_MEMORY = 64 * 1024 * 1024
+# Members compressed ahead of being appended to their zip are spilled to temporary files beyond this size
+MAX_COMPRESSED_IN_MEMORY = 4 * 1024 * 1024
+# Number of archive listings kept in memory by ArchiveIndex
+ARCHIVE_INDEX_CACHE_SIZE = 256
+WRITABLE_COMPRESSIONS = (zf.ZIP_STORED, zf.ZIP_DEFLATED, zf.ZIP_BZIP2, zf.ZIP_LZMA)
+# Earliest date a zip member can have
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+COMPRESSIONS = {'stored': zf.ZIP_STORED, 'deflated': zf.ZIP_DEFLATED, 'bzip2': zf.ZIP_BZIP2, 'lzma': zf.ZIP_LZMA}
+# Levels accepted by each compression, the others ignore the level
+COMPRESSION_LEVELS = {zf.ZIP_DEFLATED: range(0, 10), zf.ZIP_BZIP2: range(1, 10)}
+# Payloads that are already compressed, which are stored as they are rather than compressed again
+STORED_EXTENSIONS = (
+    'zip', 'gz', 'tgz', 'bz2', 'xz', '7z', 'rar', 'zst', 'lz4',
+    'png', 'jpg', 'jpeg', 'gif', 'webp', 'heic', 'mp3', 'mp4', 'mov', 'mkv',
+    'h5', 'hdf5', 'docx', 'xlsx', 'pptx',
+)
+# Size of the first block of a file used to estimate its entropy
+ENTROPY_SAMPLE_SIZE = 64 * 1024
+# Entropy (in bits per byte) above which a sample is considered incompressible, random data being close to 8
+MAX_COMPRESSIBLE_ENTROPY = 7.5
+MANIFEST_SUFFIX = ".manifest.csv"
+MANIFEST_FIELDS = ('path', 'size', 'sha256')
 
-def _sanitize_member_path(member, extraction_path):
+class MemberPathValidator:
     """
-    Prevents ZipSlip vulnerability by ensuring the extracted path 
-    does not escape the intended target directory.
+    Prevents ZipSlip vulnerability by ensuring that extracted paths do not escape the intended target
+    directory. The target is resolved once, and member names are checked in batches: only the names that
+    are absolute or contain '..' need normalizing, and the folders they go through are resolved once each,
+    to catch symlinks pointing outside the target.
     """
-    # 1. Join extraction path and member path
-    target = os.path.join(extraction_path, member)
-    # 2. Resolve to absolute path
-    abs_target = os.path.abspath(target)
-    # 3. Check if the absolute target path is still within the extraction path
-    if not abs_target.startswith(os.path.abspath(extraction_path) + os.sep):
-        # We allow target == extraction_path for cases where the zip contains only '.'
-        if abs_target != os.path.abspath(extraction_path):
-            # Log and raise an error if a path attempts to escape the extraction directory
-            logger.error(f"ZipSlip attempt prevented: {member} tried to escape {extraction_path}")
-            raise Exception(f"Potential ZipSlip attempt detected for: {member}")
-    return abs_target
+
+    def __init__(self, extraction_path):
+        self.extraction_path = extraction_path
+        self.real_root = os.path.realpath(extraction_path)
+        # {relative folder: whether it resolves inside the target}
+        self._safe_folders = {"": True}
+
+    def _inside(self, real_path):
+        # We allow the target itself for cases where the zip contains only '.'
+        return real_path == self.real_root or real_path.startswith(self.real_root.rstrip(os.sep) + os.sep)
+
+    @staticmethod
+    def _climbs_out(path):
+        if os.path.isabs(path) or os.path.splitdrive(path)[0]:
+            return True
+        if ".." not in path:
+            return False
+        normalized = os.path.normpath(path)
+        return normalized == ".." or normalized.startswith(".." + os.sep)
+
+    def _folder_is_safe(self, folder):
+        if folder not in self._safe_folders:
+            self._safe_folders[folder] = self._inside(os.path.realpath(os.path.join(self.real_root, folder)))
+        return self._safe_folders[folder]
+
+    def unsafe_members(self, names, links=None):
+        """
+        Returns the names that would be written outside the target: absolute paths, paths climbing out
+        with '..' and paths going through a folder (e.g. an existing symlink) resolving outside of it.
+        links maps the names of link members to (target, is_symlink), and the links pointing outside are
+        returned as well: symlink targets are relative to the link's folder, hard link targets to the root.
+        """
+        unsafe = []
+        sep, safe_folders = os.sep, self._safe_folders
+        for name in names:
+            path = name.replace(os.altsep, sep) if os.altsep else name
+            # Only absolute paths, drive letters and '..' need normalizing
+            if (path[:1] == sep or ".." in path or ":" in path[:2]) and self._climbs_out(path):
+                unsafe.append(name)
+                continue
+            folder = path.rstrip(sep).rpartition(sep)[0]
+            if not safe_folders.get(folder) and not self._folder_is_safe(folder):
+                unsafe.append(name)
+        for name, (target, is_symlink) in (links or {}).items():
+            if is_symlink:
+                target = os.path.join(os.path.dirname(name), target) if not os.path.isabs(target) else target
+            if self._climbs_out(target) and name not in unsafe:
+                unsafe.append(name)
+        return unsafe
+
+    def validate(self, names, links=None):
+        """Raises an error listing every unsafe member (see unsafe_members), if there is any."""
+        unsafe = self.unsafe_members(names, links)
+        if unsafe:
+            for name in unsafe:
+                # Log and raise an error if a path attempts to escape the extraction directory
+                logger.error(f"ZipSlip attempt prevented: {name} tried to escape the extraction folder")
+            raise Exception(f"Potential ZipSlip attempt detected for {len(unsafe)} member(s): {', '.join(unsafe[:10])}")
+
 
 def getext(path):
     if path.endswith(".tar.gz"):
         return "tar.gz"
     return os.path.splitext(path.lower())[1][1:]
 
+ARCHIVE_SUFFIXES = ("zip", "rar", "tar.gz", "tgz", "tar")
+UNRAR_MISSING = (
+    "The 'unrar' system utility is missing. "
+    "Please install it. Check https://github.com/nccr-catalysis-org/nccr_cat_scripts/blob/master/README.md#installing-unrar"
+)
+
+
+def _open_archive(archive_fp, ext=None):
+    if ext is None:
+        ext = getext(archive_fp)
+    if ext == "zip":
+        return zf.ZipFile(archive_fp, "r")
+    elif ext == "rar":
+        return rarfile.RarFile(archive_fp, "r")
+    elif ext in ["tar.gz", "tgz", "tar"]:
+        # "r:*" opens the file for reading with transparent compression (gz, bz2, or none)
+        return tarfile.open(archive_fp, "r:*")
+    raise ValueError(f"Unsupported file format for : {archive_fp}")
+
+
+def _archive_names(f):
+    """Lists the member names of an open zip, rar or tar archive, as read from its central directory/headers."""
+    if isinstance(f, tarfile.TarFile):
+        return f.getnames()
+    return f.namelist()
+
+
+def _single_root_from_names(namelist):
+    """
+    Returns the name of the single top-level folder of an archive listing (ignoring system files),
+    or False if there is none or more than one.
+    """
+    # Collect all unique top-level directory names
+    top_levels = set()
+    for name in namelist:
+        # Ignore __MACOSX or .DS_Store
+        if True in [i in name for i in SYSTEM_FILES_TO_IGNORE]:
+            continue
+        # Split 'folder/file.txt' into 'folder' and 'file.txt'
+        root_name = name.split(os.sep, 1)[0]
+        # Only consider entries that contain subdirectories or are explicit directories
+        if os.sep in name or name.endswith(os.sep):
+            top_levels.add(root_name)
+
+    # Check if there is exactly one top-level component (indicating a wrapped archive)
+    if len(top_levels) == 1:
+        return list(top_levels)[0]
+    return False
+
+
+class ArchiveIndex:
+    """
+    The member names of an archive, read once and cached per path, size and modification time, so that
+    the single root folder check, the path sanitizer and the extraction all work from the same listing.
+    Listing a tar means decompressing all of it, so a cached tar index also lets it be extracted in one pass;
+    it keeps the targets of the tar's links (see MemberPathValidator.unsafe_members) to check them up front.
+    """
+    _cache = OrderedDict()
+
+    def __init__(self, names, links=None):
+        self.names = names
+        self.links = links or {}
+        self.single_root_folder = _single_root_from_names(names)
+
+    @staticmethod
+    def _key(archive_fp):
+        stat = os.stat(archive_fp)
+        return os.path.abspath(archive_fp), stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def cached(cls, archive_fp):
+        """The index of archive_fp if it was read since the archive last changed, None otherwise."""
+        key = cls._key(archive_fp)
+        index = cls._cache.get(key)
+        if index is not None:
+            cls._cache.move_to_end(key)
+        return index
+
+    @classmethod
+    def remember(cls, archive_fp, names, links=None):
+        """Caches the listing of archive_fp, when it was read by other means (e.g. while extracting)."""
+        index = cls(list(names), links)
+        key = cls._key(archive_fp)
+        cls._cache[key] = index
+        cls._cache.move_to_end(key)
+        while len(cls._cache) > ARCHIVE_INDEX_CACHE_SIZE:
+            cls._cache.popitem(last=False)
+        return index
+
+    @classmethod
+    def read(cls, archive_fp, ext=None):
+        """The index of archive_fp, from the cache or read from the archive."""
+        index = cls.cached(archive_fp)
+        if index is None:
+            if ext is None:
+                ext = getext(archive_fp)
+            links = None
+            if ext in ["tar.gz", "tgz", "tar"]:
+                names, links = [], {}
+                with _open_tar_stream(archive_fp) as f:
+                    for member in f:
+                        names.append(member.name)
+                        links.update(_tar_link(member))
+            else:
+                with _open_archive(archive_fp, ext) as f:
+                    names = _archive_names(f)
+            index = cls.remember(archive_fp, names, links)
+        return index
+
+
 def is_single_root_folder(archive_fp, ext=None):
     """
     Checks if the zip file contains only a single top-level folder (excluding __MACOSX 
-    entries), and returns True if so, False otherwise.
+    entries), and returns its name if so, False otherwise.
     """
     if ext is None:
         ext = getext(archive_fp)
-    try:
-        if ext == "zip":
-            with zf.ZipFile(archive_fp, "r") as f:
-                namelist = f.namelist()
-        
-        elif ext == "rar":
-            try:
-                with rarfile.RarFile(archive_fp, "r") as f:
-                    namelist = f.namelist()
-            except rarfile.RarCannotExec:
-                logger.error(
-                f"Cannot extract {os.path.basename(archive_fp)}. "
-                "The 'unrar' system utility is missing. "
-                "Please install it. Check https://github.com/nccr-catalysis-org/nccr_cat_scripts/blob/master/README.md#installing-unrar"
-            )
-        
-        elif ext in [".tar.gz", ".tgz", ".tar"]:
-            with tarfile.open(archive_fp, "r") as f:
-                namelist = f.getnames()
-        
-        else:
-            logger.error(f"Unsupported file format for : {archive_fp}")
-            return False
-
-        if not namelist:
-            return False
-
-        # Collect all unique top-level directory names
-        top_levels = set()
-        for name in namelist:
-            # Ignore __MACOSX or .DS_Store
-            if True in [i in name for i in SYSTEM_FILES_TO_IGNORE]:
-                continue
-            # Split 'folder/file.txt' into 'folder' and 'file.txt'
-            root_name = name.split(os.sep, 1)[0]
-            # Only consider entries that contain subdirectories or are explicit directories
-            if os.sep in name or name.endswith(os.sep):
-                top_levels.add(root_name)
-
-        # Check if there is exactly one top-level component (indicating a wrapped archive)
-        if len(top_levels) == 1:
-            return list(top_levels)[0]
-        
+    if ext not in ["zip", "rar", "tar.gz", "tgz", "tar"]:
+        logger.error(f"Unsupported file format for : {archive_fp}")
         return False
+    try:
+        return ArchiveIndex.read(archive_fp, ext).single_root_folder
     except Exception as e:
         # Log error if the zip file inspection fails
         logger.error(f"Error inspecting {os.path.basename(archive_fp)}: {e}")
         return False
 
-def extract_zip(zip_fp, extraction_path, remove_archives, extracted=None):
-    with zf.ZipFile(zip_fp, "r") as f:
-        for member in f.namelist():
-            # Exclude SYSTEM_FILES_TO_IGNORE entries during extraction
-            if member.startswith(SYSTEM_FILES_TO_IGNORE):
-                continue
-            
-            # Sanitize the path before extraction to prevent ZipSlip
-            _sanitize_member_path(member, extraction_path)
-            
-            # Extract the member to the determined path
-            f.extract(member, path=extraction_path)
-    
-    if extracted is not None:
-        extracted.add(zip_fp)
-    if remove_archives:
-        os.remove(zip_fp)
-    
 
-def extract_rar(rar_fp, extraction_path, remove_rars, extracted=None):
-    try:
-        with rarfile.RarFile(rar_fp, "r") as f:
-            for member in f.namelist():
-                # Exclude SYSTEM_FILES_TO_IGNORE entries
-                if member.startswith(tuple(SYSTEM_FILES_TO_IGNORE)):
-                    continue
-                
-                # Sanitize the path before extraction
-                _sanitize_member_path(member, extraction_path)
-                
-                # Extract the member
-                f.extract(member, path=extraction_path)
-    except rarfile.RarCannotExec:
-        logger.error(
-        f"Cannot extract {os.path.basename(rar_fp)}. "
-        "The 'unrar' system utility is missing. "
-        "Please install it. Check https://github.com/nccr-catalysis-org/nccr_cat_scripts/blob/master/README.md#installing-unrar"
-    )
-    
-    if extracted is not None:
-        extracted.add(rar_fp)
-    if remove_rars:
-        os.remove(rar_fp)
-
-def extract_tar(tar_fp, extraction_path, remove_tars, extracted=None):
-    # "r:*" opens the file for reading with transparent compression (gz, bz2, or none)
-    with tarfile.open(tar_fp, "r:*") as f:
-        for member in f.getmembers():
-            # member is a TarInfo object; we use member.name for path logic
-            if member.name.startswith(tuple(SYSTEM_FILES_TO_IGNORE)):
-                continue
-            
-            # Sanitize the path using the string name
-            _sanitize_member_path(member.name, extraction_path)
-            
-            # Extract the member object
-            f.extract(member, path=extraction_path)
-    
-    if extracted is not None:
-        extracted.add(tar_fp)
-    if remove_tars:
-        os.remove(tar_fp)
-        
-def extract_recursively_in_folder(folder, remove_archives=False):
-    # Loop continuously to handle archives that extract other archives within the same folder
-    while True:
-        extracted = set()
-        # Find all zip files in the current folder
-        archive_fps = [os.path.join(folder, i) for i in os.listdir(folder) if i.endswith(("zip", "rar", "tar.gz", "tgz", "tar"))]
+def _tar_link(member):
+    """The {name: (target, is_symlink)} entry of a tar member if it is a link, in the form MemberPathValidator takes."""
+    if member.issym() or member.islnk():
+        return {member.name: (member.linkname, member.issym())}
+    return {}
+
+
+def _extract_members(f, extraction_path, names=None, links=None):
+    """
+    Extracts all members of an open archive except system files into extraction_path, and returns
+    the names of all its members and the targets of its links. The names (and links) can be given
+    from an ArchiveIndex, rather than read from the open archive.
+    All the given or listed names are checked against ZipSlip before anything is extracted;
+    tars read as streams without an index have each member (and link target) checked as it comes.
+    """
+    is_tar = isinstance(f, tarfile.TarFile)
+    validator = MemberPathValidator(extraction_path)
+    check_each = is_tar and names is None
+    if names is None and not is_tar:
+        names = f.namelist()
+    if names is not None:
+        # Sanitize the paths before extraction to prevent ZipSlip
+        validator.validate(
+            [name for name in names if not name.startswith(SYSTEM_FILES_TO_IGNORE)],
+            {name: link for name, link in (links or {}).items() if not name.startswith(SYSTEM_FILES_TO_IGNORE)},
+        )
+
+    member_names, member_links = [], {}
+    # member is a TarInfo object for tar files; we use member.name for path logic.
+    # Iterating a TarFile reads the members one by one, so tars opened as streams are read in a single pass.
+    for member in f if is_tar else names:
+        name = member.name if is_tar else member
+        member_names.append(name)
+        # Exclude SYSTEM_FILES_TO_IGNORE entries during extraction
+        if name.startswith(SYSTEM_FILES_TO_IGNORE):
+            continue
+        if is_tar:
+            link = _tar_link(member)
+            member_links.update(link)
+            if check_each:
+                validator.validate([name], link)
         
-        for archive_fp in archive_fps:
-            ext = getext(archive_fp)
-            # Determine extraction path: 
-            # Unwrap (to parent folder) if it contains a single root folder.
-            # Otherwise, create a container folder (named after the zip file, minus extension).
-            if is_single_root_folder(archive_fp):
-                 # Unwrap case: Extract contents directly into the current folder
-                extraction_path = os.path.split(archive_fp)[0]
-                logger.info(f"-> Unwrapping {os.path.basename(archive_fp)} into {os.path.basename(extraction_path)}/")
-            else:
-                # Container case: Extract into a new folder named after the zip file
-                extraction_path = archive_fp[:-(len(ext) + 1)]
-                logger.info(f"-> Creating container and extracting {os.path.basename(archive_fp)} to {os.path.basename(extraction_path)}/")
+        # Extract the member to the determined path
+        f.extract(member, path=extraction_path)
+    return member_names, member_links
+
+
+@contextmanager
+def _open_tar_stream(tar_fp):
+    """
+    Opens a tar for a single sequential pass, with transparent decompression. Gzipped tars are
+    decompressed by pigz in a separate process when it is installed, and by tarfile otherwise.
+    """
+    pigz = shutil.which("pigz") if getext(tar_fp) in ["tar.gz", "tgz"] else None
+    if pigz is None:
+        # "r|*" reads the tar as a stream, with transparent decompression (gz, bz2, xz, or none)
+        with tarfile.open(tar_fp, "r|*") as f:
+            yield f
+        return
+
+    proc = subprocess.Popen([pigz, "-dc", tar_fp], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        with tarfile.open(fileobj=proc.stdout, mode="r|") as f:
+            yield f
+        # Read the padding after the end of archive, so that pigz does not fail on a closed pipe
+        while proc.stdout.read(CHUNK_SIZE):
+            pass
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise tarfile.ReadError(f"pigz could not decompress {os.path.basename(tar_fp)}: {stderr.decode(errors='replace').strip()}")
 
+
+def _merge_move(src_dir, dst_dir):
+    """Moves the content of src_dir into dst_dir, merging folders and overwriting files as an extraction would."""
+    os.makedirs(dst_dir, exist_ok=True)
+    for name in os.listdir(src_dir):
+        src, dst = os.path.join(src_dir, name), os.path.join(dst_dir, name)
+        src_is_dir = os.path.isdir(src) and not os.path.islink(src)
+        if src_is_dir and os.path.isdir(dst) and not os.path.islink(dst):
+            _merge_move(src, dst)
+            continue
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst)
+        elif os.path.lexists(dst) and src_is_dir:
+            os.remove(dst)
+        os.replace(src, dst)
+
+
+def _find_archives(folder):
+    """Lists the archives in folder and all its subfolders, in a single walk of the tree."""
+    archive_fps = []
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        archive_fps.extend(os.path.join(root, i) for i in sorted(files) if i.endswith(ARCHIVE_SUFFIXES))
+    return archive_fps
+
+
+def _extraction_target(archive_fp, ext, single_root_folder):
+    """Folder an archive is extracted into: its own folder when unwrapped, a container named after it otherwise."""
+    return os.path.split(archive_fp)[0] if single_root_folder else archive_fp[:-(len(ext) + 1)]
+
+
+def _expected_extraction_target(archive_fp):
+    """
+    The folder archive_fp will be extracted into, as far as can be told before extracting it. Listing a tar
+    costs a full read, so uncached tars (and unreadable archives) are assumed to be unwrapped into their folder.
+    """
+    ext = getext(archive_fp)
+    folder = os.path.split(archive_fp)[0]
+    if ext in ["tar.gz", "tgz", "tar"] and ArchiveIndex.cached(archive_fp) is None:
+        return folder
+    try:
+        return _extraction_target(archive_fp, ext, ArchiveIndex.read(archive_fp, ext).single_root_folder)
+    except Exception:
+        return folder
+
+
+def _overlapping(path, other):
+    """Whether one of the two folders is, or contains, the other."""
+    return path == other or path.startswith(other + os.sep) or other.startswith(path + os.sep)
+
+
+def _extraction_path(archive_fp, ext, single_root_folder):
+    extraction_path = _extraction_target(archive_fp, ext, single_root_folder)
+    if single_root_folder:
+        # Unwrap case: Extract contents directly into the current folder
+        logger.info(f"-> Unwrapping {os.path.basename(archive_fp)} into {os.path.basename(extraction_path)}/")
+    else:
+        # Container case: Extract into a new folder named after the zip file
+        logger.info(f"-> Creating container and extracting {os.path.basename(archive_fp)} to {os.path.basename(extraction_path)}/")
+    return extraction_path
+
+
+def _extract_tar_archive(archive_fp, ext):
+    """
+    Tars have no central directory, so listing them costs a full read. When their ArchiveIndex is cached, they are
+    extracted straight to the unwrap or container location; otherwise they are extracted in a single streaming pass
+    into a private folder next to them, moved to the unwrap or container location, and their listing is cached.
+    """
+    index = ArchiveIndex.cached(archive_fp)
+    if index is not None:
+        extraction_path = _extraction_path(archive_fp, ext, index.single_root_folder)
+        os.makedirs(extraction_path, exist_ok=True)
+        with _open_tar_stream(archive_fp) as f:
+            member_names, _ = _extract_members(f, extraction_path, index.names, index.links)
+        return extraction_path, member_names
+
+    temp_dir = tempfile.mkdtemp(dir=os.path.split(archive_fp)[0], prefix=f".{os.path.basename(archive_fp)}.")
+    try:
+        with _open_tar_stream(archive_fp) as f:
+            member_names, links = _extract_members(f, temp_dir)
+        index = ArchiveIndex.remember(archive_fp, member_names, links)
+        extraction_path = _extraction_path(archive_fp, ext, index.single_root_folder)
+        _merge_move(temp_dir, extraction_path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return extraction_path, member_names
+
+
+def _extract_archive(archive_fp, remove_archives=False):
+    """
+    Extracts a single archive next to itself, reading it only once. The archive is unwrapped into the parent
+    folder if it contains a single root folder, otherwise it is extracted into a new container folder named
+    after it (minus extension). For zips and rars, the listing read to decide where to extract is also the one
+    used for the extraction; tars are streamed (see _extract_tar_archive). Returns the extraction folder and
+    the paths of the archives that were extracted from it. Errors are raised to the caller.
+    """
+    ext = getext(archive_fp)
+    if ext in ["tar.gz", "tgz", "tar"]:
+        extraction_path, member_names = _extract_tar_archive(archive_fp, ext)
+    else:
+        with _open_archive(archive_fp, ext) as f:
+            index = ArchiveIndex.cached(archive_fp) or ArchiveIndex.remember(archive_fp, _archive_names(f))
+            extraction_path = _extraction_path(archive_fp, ext, index.single_root_folder)
             # Ensure the target directory exists (for the container case)
             os.makedirs(extraction_path, exist_ok=True)
-            
-            # Perform the extraction
-            try:
-                if ext == "zip":
-                    extract_zip(archive_fp, extraction_path, remove_archives, extracted=extracted)
-                elif ext == "rar":
-                    extract_rar(archive_fp, extraction_path, remove_archives, extracted=extracted)
-                elif ext in ["tar.gz", "tgz", "tar"]:
-                    extract_tar(archive_fp, extraction_path, remove_archives, extracted=extracted)
-            except zf.BadZipFile:
-                logger.error(f"Error: {os.path.basename(archive_fp)} is a bad zip file.")
-            except (rarfile.BadRarFile, rarfile.NotRarFile):
-                logger.error(f"Error: {os.path.basename(archive_fp)} is a bad or invalid RAR file.")
-            except tarfile.ReadError:
-                logger.error(f"Error: {os.path.basename(archive_fp)} is a bad tar file or has unsupported compression.")
-            except Exception as e:
-                logger.error(f"Error extracting {os.path.basename(archive_fp)}: {e}")
-        
-        # Check if new zip files were created during this iteration. 
-        # If no new zips were extracted (the set difference is empty), break the loop.
-        current_archive_fps = set(os.path.join(folder, i) for i in os.listdir(folder) if i.endswith("zip"))
-        if not(current_archive_fps - extracted):
-            break
-    
-    # After iterative extraction is complete, recursively process all subfolders
-    subfolders = [
-        full_path 
-        for i in os.listdir(folder) 
-        if os.path.isdir(full_path := os.path.join(folder, i))
+            member_names, _ = _extract_members(f, extraction_path, index.names)
+
+    if remove_archives:
+        os.remove(archive_fp)
+    nested_fps = [
+        full_path
+        for name in member_names
+        if name.endswith(ARCHIVE_SUFFIXES) and os.path.isfile(full_path := os.path.normpath(os.path.join(extraction_path, name)))
     ]
-    
-    for subfolder in subfolders:
-        extract_recursively_in_folder(subfolder, remove_archives=remove_archives)
+    return extraction_path, nested_fps
 
 
-def extract_recursively_from_file(filepath, remove_archives=False):
+def _try_extract_archive(archive_fp, remove_archives=False):
+    """Same as _extract_archive, but logs errors and returns None instead of raising (used by the workers)."""
+    try:
+        return _extract_archive(archive_fp, remove_archives)
+    except zf.BadZipFile:
+        logger.error(f"Error: {os.path.basename(archive_fp)} is a bad zip file.")
+    except rarfile.RarCannotExec:
+        logger.error(f"Cannot extract {os.path.basename(archive_fp)}. {UNRAR_MISSING}")
+    except (rarfile.BadRarFile, rarfile.NotRarFile):
+        logger.error(f"Error: {os.path.basename(archive_fp)} is a bad or invalid RAR file.")
+    except tarfile.ReadError:
+        logger.error(f"Error: {os.path.basename(archive_fp)} is a bad tar file or has unsupported compression.")
+    except Exception as e:
+        logger.error(f"Error extracting {os.path.basename(archive_fp)}: {e}")
+    return None
+
+
+def _extract_queue(archive_fps, remove_archives=False, pool=None):
     """
-    Handles the initial extraction of a single zip file, 
-    then calls the recursive folder processing function.
+    Processes a work queue of archives: each archive is extracted once and the nested archives
+    found in its member list are pushed onto the queue, so no folder is ever listed again.
+    With a pool, archives are extracted concurrently as soon as they are queued, except that an archive
+    whose extraction folder overlaps the one of an archive running or queued before it waits for it
+    (concurrent extractions into the same folders would race on creating their subfolders).
     """
-    try:
-        ext = getext(filepath)
-        # Use os.path.splitext to robustly get the base name for the extraction directory
-        if is_single_root_folder(filepath):
-             # Unwrap case: Extract contents directly into the current folder
-            extraction_dir = os.path.split(filepath)[0]
-            logger.info(f"-> Unwrapping {os.path.basename(filepath)} into {os.path.basename(extraction_dir)}/")
-        else:
-            # Container case: Extract into a new folder named after the zip file
-            extraction_dir = filepath[:-(len(ext) + 1)]
-            logger.info(f"-> Creating container and extracting {os.path.basename(filepath)} to {os.path.basename(extraction_dir)}/")
+    queue = deque(archive_fps)
+    queued = set(archive_fps)
 
-        # Ensure the target directory exists (for the container case)
-        os.makedirs(extraction_dir, exist_ok=True)
+    def push(result):
+        if result is None:
+            return
+        for nested_fp in result[1]:
+            if nested_fp not in queued:
+                queued.add(nested_fp)
+                queue.append(nested_fp)
 
-        logger.info(f"Initial extract: {os.path.basename(filepath)} to {os.path.basename(extraction_dir)}/")
-        if ext == "zip":
-            extract_zip(filepath, extraction_dir, remove_archives)
-        elif ext == "rar":
-            extract_rar(filepath, extraction_dir, remove_archives)
-        elif ext in ["tar.gz", "tgz", "tar"]:
-            extract_tar(filepath, extraction_dir, remove_archives)
+    if pool is None:
+        while queue:
+            push(_try_extract_archive(queue.popleft(), remove_archives))
+        return
+
+    running = {} # future: extraction folder
+    while queue or running:
+        waiting = deque()
+        waiting_targets = []
+        while queue:
+            archive_fp = queue.popleft()
+            target = os.path.abspath(_expected_extraction_target(archive_fp))
+            if any(_overlapping(target, other) for other in [*running.values(), *waiting_targets]):
+                waiting.append(archive_fp)
+                waiting_targets.append(target)
+            else:
+                running[pool.submit(_try_extract_archive, archive_fp, remove_archives)] = target
+        queue = waiting
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            del running[future]
+            push(future.result())
+
+
+def _run_extraction(archive_fps, remove_archives=False, jobs=1):
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=helpers.init_worker, initargs=(logger.name, logger.level)) as pool:
+            _extract_queue(archive_fps, remove_archives=remove_archives, pool=pool)
+    else:
+        _extract_queue(archive_fps, remove_archives=remove_archives)
+
+
+def extract_recursively_in_folder(folder, remove_archives=False, jobs=1):
+    """
+    Extracts every archive found in folder and its subfolders, including archives extracted from other archives.
+    The tree is scanned once; with jobs > 1, archives are extracted in a process pool.
+    """
+    _run_extraction(_find_archives(folder), remove_archives=remove_archives, jobs=jobs)
+
+
+def extract_recursively_from_file(filepath, remove_archives=False, jobs=1):
+    """
+    Handles the initial extraction of a single zip file, 
+    then extracts recursively the archives it contained.
+    """
+    try:
+        logger.info(f"Initial extract: {os.path.basename(filepath)}")
+        _, nested_fps = _extract_archive(filepath, remove_archives)
     except zf.BadZipFile:
         logger.error(f"Error: {os.path.basename(filepath)} is a bad zip file, aborting recursive extraction.")
         return
@@ -275,196 +562,431 @@ def extract_recursively_from_file(filepath, remove_archives=False):
         logger.error(f"Error extracting {os.path.basename(filepath)}: {e}")
         return
 
-    # Continue recursively in the newly created folder
-    extract_recursively_in_folder(extraction_dir, remove_archives=remove_archives)
+    # Continue recursively with the archives that were inside
+    _run_extraction(nested_fps, remove_archives=remove_archives, jobs=jobs)
     
 
-def extract_recursively(path, remove_archives=False):
+def extract_recursively(path, remove_archives=False, jobs=1):
     """
     Main entry point: normalizes the path and calls the appropriate handler 
     based on whether the path is a file (ending in .zip) or a folder.
     """
     path = os.path.abspath(path)
     if path.lower().endswith(".zip"):
-        extract_recursively_from_file(path, remove_archives=remove_archives)
+        extract_recursively_from_file(path, remove_archives=remove_archives, jobs=jobs)
     else:
-        extract_recursively_in_folder(path, remove_archives=remove_archives)
+        extract_recursively_in_folder(path, remove_archives=remove_archives, jobs=jobs)
         
         
-def _make_naked(archive_fp: str, single_root_folder: str) -> bool:
+def choose_compression(name: str, sample: bytes, compression: int = zf.ZIP_DEFLATED) -> int:
     """
-    Rewrites a 'dressed' zip file (containing only a single folder)
-    to a 'naked' zip file (containing the folder's contents).
-    This uses temporary disk space to perform the rewrite safely, overwriting the original.
+    Picks the compression of a zip member: ZIP_STORED for payloads that are already compressed,
+    judging by the extension of name or by the byte entropy of sample (the first block of its data),
+    and compression otherwise.
     """
-    temp_dir = None
-    try:
-        # Create a temporary directory for extraction and zipping
-        # We ensure it's in the same directory as the zip_fp if possible
-        temp_dir = os.path.join(os.path.dirname(archive_fp) or '.', f"temp_naked_clean_{os.path.basename(archive_fp)}_data")
-        os.makedirs(temp_dir, exist_ok=True)
+    # Matched on the last suffix, as getext gives 'tar.gz' for gzipped tars
+    if compression == zf.ZIP_STORED or os.path.splitext(name.lower())[1][1:] in STORED_EXTENSIONS:
+        return zf.ZIP_STORED
+    if sample:
+        counts = np.bincount(np.frombuffer(sample, dtype=np.uint8), minlength=256)
+        probabilities = counts[counts > 0] / len(sample)
+        if -(probabilities * np.log2(probabilities)).sum() > MAX_COMPRESSIBLE_ENTROPY:
+            return zf.ZIP_STORED
+    return compression
 
-        ext = getext(archive_fp)
-            
-        if ext == "zip":
-            extract_zip(archive_fp, temp_dir, False, extracted=None)
-        elif ext == "rar":
-            extract_rar(archive_fp, temp_dir, False, extracted=None)
-        elif ext in ["tar.gz", "tgz", "tar"]:
-            extract_tar(archive_fp, temp_dir, False, extracted=None)
-        
-        # 2. Create the new (naked) zip file
-        new_zip_fp = os.path.join(temp_dir, 'naked_temp.zip')
-        naked_content_path = os.path.join(temp_dir, single_root_folder)
-        
-        with zf.ZipFile(new_zip_fp, 'w', zf.ZIP_DEFLATED) as zf_out:
-            for root, _, files in os.walk(naked_content_path):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    # Archive name: path relative to the content folder (flattens the structure)
-                    arcname = os.path.relpath(full_path, naked_content_path)
-                    zf_out.write(full_path, arcname)
-
-        # 3. Replace the original zip file
-        shutil.copyfile(new_zip_fp, archive_fp)
-        logger.debug(f"CLEANED: Made '{os.path.basename(archive_fp)}' naked.")
-        return True
 
+# --- zipfile internals ---
+# Copying members raw and compressing them outside of a ZipFile need what zipfile does not expose: the local
+# header layout, the lock, write offset and state of a ZipFile, its compressors and the level of a member.
+# They are only used in this section, and match CPython's zipfile from 3.8 to 3.13.
+
+def _get_compressor(compress_type: int, level: Optional[int] = None):
+    """The compressor ZipFile uses for compress_type at level, None for ZIP_STORED."""
+    return zf._get_compressor(compress_type, level)
+
+
+def _set_compress_level(info: zf.ZipInfo, level: Optional[int]):
+    """Sets the level ZipFile.open compresses info with, in place of the level of the ZipFile."""
+    if 'compress_level' in zf.ZipInfo.__slots__:
+        info.compress_level = level # Python 3.13+
+    else:
+        info._compresslevel = level
+
+
+def copy_member_raw(zf_in: zf.ZipFile, info: zf.ZipInfo, zf_out: zf.ZipFile, arcname: Optional[str] = None):
+    """
+    Copies a member of zf_in into zf_out (optionally renamed to arcname) without decompressing
+    and recompressing it: its compressed bytes, CRC and sizes are copied as they are.
+    """
+    with zf_in._lock:
+        zf_in.fp.seek(info.header_offset)
+        fheader = zf_in.fp.read(zf.sizeFileHeader)
+        if len(fheader) != zf.sizeFileHeader:
+            raise zf.BadZipFile("Truncated file header")
+        fheader = struct.unpack(zf.structFileHeader, fheader)
+        if fheader[zf._FH_SIGNATURE] != zf.stringFileHeader:
+            raise zf.BadZipFile("Bad magic number for file header")
+        # The data starts after the local header's own name and extra field
+        zf_in.fp.seek(fheader[zf._FH_FILENAME_LENGTH] + fheader[zf._FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+
+        out_info = copy.copy(info)
+        if arcname is not None:
+            out_info.filename = out_info.orig_filename = arcname
+        # FileHeader adds its own zip64 field when needed
+        out_info.extra = zf._strip_extra(info.extra, (1,))
+        return write_member_raw(zf_out, out_info, zf_in.fp)
+
+
+def write_member_raw(zf_out: zf.ZipFile, info: zf.ZipInfo, data) -> zf.ZipInfo:
+    """
+    Appends a member whose data is already compressed to zf_out: info must hold its compress_type, CRC,
+    file_size and compress_size, and info.compress_size bytes are read from the binary file object data.
+    """
+    # Sizes and CRC are known, so they go in the local header rather than in a data descriptor
+    info.flag_bits &= ~0x08
+    zip64 = info.file_size > zf.ZIP64_LIMIT or info.compress_size > zf.ZIP64_LIMIT
+    with zf_out._lock:
+        if zf_out.mode not in ('w', 'x', 'a') or not zf_out.fp:
+            raise ValueError("Raw writes require a zip file open for writing")
+        if zf_out._writing:
+            raise ValueError("Can't write to the ZIP file while there is another write handle open on it.")
+        if zip64 and not zf_out._allowZip64:
+            raise zf.LargeZipFile("Filesize would require ZIP64 extensions")
+        if zf_out._seekable:
+            zf_out.fp.seek(zf_out.start_dir)
+        info.header_offset = zf_out.fp.tell()
+        zf_out._didModify = True
+        zf_out.fp.write(info.FileHeader(zip64))
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = data.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise zf.BadZipFile(f"Truncated data for member {info.filename}")
+            zf_out.fp.write(chunk)
+            remaining -= len(chunk)
+        zf_out.start_dir = zf_out.fp.tell()
+        zf_out.filelist.append(info)
+        zf_out.NameToInfo[info.filename] = info
+    return info
+
+# --- End zipfile internals ---
+
+
+def _compress_member(full_path: str, arcname: str, compression: int = zf.ZIP_DEFLATED, level: Optional[int] = None,
+                     hash_content: bool = False):
+    """
+    Compresses a file on its own, outside of any ZipFile, so that several files can be compressed
+    in parallel threads (zlib, bz2 and lzma release the GIL). The compression is picked by
+    choose_compression. Returns the member's ZipInfo, with its CRC and sizes, a temporary
+    file holding the compressed data, for write_member_raw, and with hash_content the sha256
+    of the file, computed while reading it for compression (None otherwise).
+    """
+    info = zf.ZipInfo.from_file(full_path, arcname)
+    digest = hashlib.sha256() if hash_content else None
+    compressed = tempfile.SpooledTemporaryFile(max_size=MAX_COMPRESSED_IN_MEMORY)
+    crc = file_size = 0
+    with open(full_path, 'rb') as f:
+        chunk = f.read(CHUNK_SIZE)
+        info.compress_type = choose_compression(arcname, chunk[:ENTROPY_SAMPLE_SIZE], compression)
+        compressor = _get_compressor(info.compress_type, level)
+        if info.compress_type == zf.ZIP_LZMA:
+            # Compressed data is terminated by an EOS marker, as ZipFile.open flags it
+            info.flag_bits |= 0x02
+        while chunk:
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            if digest:
+                digest.update(chunk)
+            compressed.write(compressor.compress(chunk) if compressor else chunk)
+            chunk = f.read(CHUNK_SIZE)
+    if compressor:
+        compressed.write(compressor.flush())
+    info.CRC = crc
+    info.file_size = file_size
+    info.compress_size = compressed.tell()
+    compressed.seek(0)
+    return info, compressed, digest.hexdigest() if digest else None
+
+
+def _write_member(zf_out: zf.ZipFile, full_path: str, arcname: str, compression: int = zf.ZIP_DEFLATED,
+                  level: Optional[int] = None, hash_content: bool = False):
+    """
+    Compresses a file into zf_out, with the compression picked by choose_compression.
+    With hash_content, returns the sha256 of the file, computed while reading it for compression.
+    """
+    info = zf.ZipInfo.from_file(full_path, arcname)
+    digest = hashlib.sha256() if hash_content else None
+    with open(full_path, 'rb') as f:
+        chunk = f.read(CHUNK_SIZE)
+        info.compress_type = choose_compression(arcname, chunk[:ENTROPY_SAMPLE_SIZE], compression)
+        # As zf_out.write does
+        _set_compress_level(info, level)
+        with zf_out.open(info, 'w') as out_stream:
+            while chunk:
+                if digest:
+                    digest.update(chunk)
+                out_stream.write(chunk)
+                chunk = f.read(CHUNK_SIZE)
+    return digest.hexdigest() if digest else None
+
+
+def _file_sha256(full_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(full_path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(manifest_fp: str) -> Dict[str, tuple]:
+    """Reads a manifest written by zip_appropriately into {path: (size, sha256)}."""
+    with open(manifest_fp, newline='', encoding='utf-8') as f:
+        return {row['path']: (int(row['size']), row['sha256']) for row in csv.DictReader(f)}
+
+
+def _write_manifest(manifest_fp: str, rows):
+    with open(manifest_fp, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(MANIFEST_FIELDS)
+        writer.writerows(rows)
+
+
+def _is_system_entry(name):
+    return True in [i in name for i in SYSTEM_FILES_TO_IGNORE]
+
+
+def _renamed_info(info, arcname, compress_type=None):
+    """A fresh ZipInfo for writing the member described by info under arcname, keeping its metadata."""
+    out_info = zf.ZipInfo(arcname, date_time=info.date_time)
+    out_info.compress_type = info.compress_type if compress_type is None else compress_type
+    if out_info.compress_type not in WRITABLE_COMPRESSIONS:
+        out_info.compress_type = zf.ZIP_DEFLATED
+    out_info.external_attr = info.external_attr
+    out_info.create_system = info.create_system
+    out_info.comment = info.comment
+    # Lets ZipFile.open decide on zip64 before the data is written
+    out_info.file_size = info.file_size
+    return out_info
+
+
+def _needs_cleaning(infolist):
+    """Whether a zip listing contains system files, a single root folder or nested zips (which may need cleaning)."""
+    names = [info.filename for info in infolist]
+    return (
+        any(_is_system_entry(name) for name in names)
+        or bool(_single_root_from_names(names))
+        or any(name.lower().endswith('.zip') for name in names)
+    )
+
+
+def _clean_nested_zip(nested_in, nested_out, max_in_memory, zip_name, member_name):
+    """
+    Cleans the nested zip written in nested_in into nested_out, if it needs cleaning (see _needs_cleaning).
+    Returns whether it was cleaned: if not, or if cleaning fails, nested_in is to be copied as it is.
+    """
+    nested_in.seek(0)
+    try:
+        with zf.ZipFile(nested_in, 'r') as nested_zip:
+            needs_cleaning = _needs_cleaning(nested_zip.infolist())
+        if needs_cleaning:
+            nested_in.seek(0)
+            _clean_zip_stream(nested_in, nested_out, max_in_memory, f"{zip_name}/{member_name}")
+        return needs_cleaning
     except Exception as e:
-        logger.error(f"Failed to make '{os.path.basename(archive_fp)}' naked: {e}")
+        # If cleaning fails, the uncleaned zip is copied instead.
+        logger.error(f"Failed to clean nested zip {member_name} inside {zip_name}: {e}")
         return False
-    finally:
-        # Clean up temporary directories
-        if temp_dir and os.path.exists(temp_dir):
-             shutil.rmtree(temp_dir)
 
 
-def _rewrite_zip_for_cleaning(zip_fp: str, temp_zip_fp: str, nested_zips_to_replace: Dict[str, str]):
+def _clean_zip_stream(src, dst, max_in_memory=DEFAULT_MAX_IN_MEMORY, zip_name=None):
     """
-    Reads from zip_fp, writes cleaned contents to temp_zip_fp.
-    - Excludes __MACOSX , .DS_Store, and Thumbs.db entries.
-    - Replaces nested zips using files provided in nested_zips_to_replace.
+    Writes a cleaned copy of the zip src into dst (paths or binary file objects, dst must be seekable),
+    streaming each member from one to the other:
+    - __MACOSX , .DS_Store, and Thumbs.db entries are skipped,
+    - a single root folder is stripped from the member names (making the zip naked),
+    - nested zips are cleaned recursively in memory, or in a temporary file when larger than max_in_memory bytes,
+      and stored; those needing no cleaning are copied as they are.
     """
-    
-    with zf.ZipFile(zip_fp, 'r') as zf_in:
-        with zf.ZipFile(temp_zip_fp, 'w', zf.ZIP_DEFLATED) as zf_out:
-            
-            # Store names of members we have already handled (replaced nested zips)
-            handled_members = set()
-
-            for member in zf_in.infolist():
-                member_name = member.filename
-                
-                # A. Skip SYSTEM_FILES_TO_IGNORE
-                if True in [i in member_name for i in SYSTEM_FILES_TO_IGNORE] :
-                    # Logging done in the main function
+    zip_name = zip_name or os.path.basename(str(src))
+    with zf.ZipFile(src, 'r') as zf_in, zf.ZipFile(dst, 'w', zf.ZIP_DEFLATED) as zf_out:
+        infolist = zf_in.infolist()
+        single_root_folder = _single_root_from_names([info.filename for info in infolist])
+        prefix = f"{single_root_folder}/" if single_root_folder else ""
+        if single_root_folder:
+            logger.debug(f"CLEANED: Made '{zip_name}' naked.")
+
+        for info in infolist:
+            member_name = info.filename
+
+            # A. Skip SYSTEM_FILES_TO_IGNORE
+            if _is_system_entry(member_name):
+                logger.info(f"ISSUE: Found __MACOSX or .DS_Store entry in {zip_name}: {member_name}")
+                continue
+
+            # B. Strip the single root folder, whose own entry is dropped
+            arcname = member_name
+            if prefix and member_name.startswith(prefix):
+                arcname = member_name[len(prefix):]
+                if not arcname:
                     continue
-                
-                # B. Check for replacement (cleaned nested zip)
-                if member_name in nested_zips_to_replace:
-                    cleaned_nested_path = nested_zips_to_replace[member_name]
-                    # Add the *cleaned* temporary zip file back to the new archive
-                    zf_out.write(cleaned_nested_path, member_name)
-                    handled_members.add(member_name)
-                
-                # C. Copy all other files/directories (including nested zips that weren't replaced)
-                elif member_name not in handled_members:
-                    # Copy the original member stream to the new zip
-                    zf_out.writestr(member, zf_in.read(member))
-
-
-def clean_zip_recursively(zip_fp: str):
+
+            # C. Clean nested zips, spilling to disk only beyond max_in_memory
+            if member_name.lower().endswith('.zip'):
+                with tempfile.SpooledTemporaryFile(max_size=max_in_memory) as nested_in, \
+                     tempfile.SpooledTemporaryFile(max_size=max_in_memory) as nested_out:
+                    with zf_in.open(info) as member_stream:
+                        shutil.copyfileobj(member_stream, nested_in, CHUNK_SIZE)
+                    if _clean_nested_zip(nested_in, nested_out, max_in_memory, zip_name, member_name):
+                        # A zip is already compressed (see STORED_EXTENSIONS), so it is stored as it is
+                        out_info = _renamed_info(info, arcname, zf.ZIP_STORED)
+                        out_info.file_size = nested_out.seek(0, os.SEEK_END)
+                        nested_out.seek(0)
+                        with zf_out.open(out_info, 'w') as out_stream:
+                            shutil.copyfileobj(nested_out, out_stream, CHUNK_SIZE)
+                        continue
+
+            # D. Copy all other files/directories (and nested zips needing no cleaning) as they are, without recompressing them
+            copy_member_raw(zf_in, info, zf_out, arcname)
+
+
+def _write_stream_member(zf_out, stream, arcname, date_time, mode, size, compression=None):
+    """
+    Writes the data read from the binary stream as the member arcname of zf_out, compressed with compression,
+    or as picked by choose_compression from its name and first block when not given.
+    """
+    info = zf.ZipInfo(arcname, date_time=max(tuple(date_time), ZIP_EPOCH))
+    info.external_attr = (mode & 0xFFFF) << 16
+    # Lets ZipFile.open decide on zip64 before the data is written
+    info.file_size = size
+    chunk = stream.read(CHUNK_SIZE)
+    info.compress_type = compression if compression is not None else choose_compression(arcname, chunk[:ENTROPY_SAMPLE_SIZE])
+    with zf_out.open(info, 'w') as out_stream:
+        while chunk:
+            out_stream.write(chunk)
+            chunk = stream.read(CHUNK_SIZE)
+
+
+def _naked_zip_stream(archive_fp, dst, max_in_memory=DEFAULT_MAX_IN_MEMORY):
+    """
+    Converts the rar or tar archive_fp into a cleaned naked zip written into dst (a path or a seekable
+    binary file object), streaming its members one by one, with no extraction to disk:
+    - __MACOSX , .DS_Store, and Thumbs.db entries are skipped,
+    - a single root folder is stripped from the member names,
+    - files are compressed as picked by choose_compression,
+    - nested zips are cleaned as in _clean_zip_stream, and stored.
+    The single root folder is found from the ArchiveIndex, which costs tars an extra read when not cached.
+    Zips cannot hold the links and special files of tars, which are skipped.
+    """
+    archive_name = os.path.basename(archive_fp)
+    ext = getext(archive_fp)
+    is_tar = ext in ["tar.gz", "tgz", "tar"]
+    single_root_folder = ArchiveIndex.read(archive_fp, ext).single_root_folder
+    prefix = f"{single_root_folder}/" if single_root_folder else ""
+    with (_open_tar_stream(archive_fp) if is_tar else _open_archive(archive_fp, ext)) as f, \
+         zf.ZipFile(dst, 'w', zf.ZIP_DEFLATED) as zf_out:
+        for member in f if is_tar else f.infolist():
+            member_name = member.name if is_tar else member.filename
+            if _is_system_entry(member_name):
+                logger.info(f"ISSUE: Found __MACOSX or .DS_Store entry in {archive_name}: {member_name}")
+                continue
+            # The single root folder's own entry is dropped
+            if prefix and member_name.rstrip('/') == single_root_folder:
+                continue
+            arcname = member_name[len(prefix):] if prefix and member_name.startswith(prefix) else member_name
+
+            if member.isdir() if is_tar else member.is_dir():
+                info = zf.ZipInfo(f"{arcname.rstrip('/')}/")
+                info.external_attr = 0o40775 << 16 | 0x10 # Unix directory, MS-DOS directory flag
+                zf_out.writestr(info, b"")
+                continue
+            if is_tar and not member.isfile() or not is_tar and member.is_symlink():
+                logger.warning(f"Skipping '{member_name}' of {archive_name}: links and special files cannot be zipped.")
+                continue
+            if is_tar:
+                date_time, mode, size, stream = time.localtime(member.mtime)[:6], member.mode, member.size, f.extractfile(member)
+            else:
+                # Rars made on Windows hold MS-DOS attributes rather than a mode
+                mode = member.mode if member.host_os == rarfile.RAR_OS_UNIX else 0o644
+                date_time, size, stream = member.date_time, member.file_size, f.open(member)
+
+            with stream:
+                if not member_name.lower().endswith('.zip'):
+                    _write_stream_member(zf_out, stream, arcname, date_time, mode, size)
+                    continue
+                # Nested zips are cleaned, and stored as a zip is already compressed (see STORED_EXTENSIONS)
+                with tempfile.SpooledTemporaryFile(max_size=max_in_memory) as nested_in, \
+                     tempfile.SpooledTemporaryFile(max_size=max_in_memory) as nested_out:
+                    shutil.copyfileobj(stream, nested_in, CHUNK_SIZE)
+                    nested = nested_out if _clean_nested_zip(nested_in, nested_out, max_in_memory, archive_name, member_name) else nested_in
+                    size = nested.seek(0, os.SEEK_END)
+                    nested.seek(0)
+                    _write_stream_member(zf_out, nested, arcname, date_time, mode, size, zf.ZIP_STORED)
+
+
+def clean_zip_recursively(zip_fp: str, output_filepath: Optional[str] = None, max_in_memory: int = DEFAULT_MAX_IN_MEMORY):
     """
     Recursively cleans a single zip file by removing __MACOSX , .DS_Store, and Thumbs.db entries, 
     making it naked, and cleaning any nested zip files within.
-    This process is done in-place by rewriting the zip file.
+    The cleaned zip is streamed to a temporary file next to its destination (output_filepath, or zip_fp itself
+    when not given), which then atomically replaces it: the source is read once and the result written once.
     """
     zip_filename = os.path.basename(zip_fp)
-    # 1. Check for Dressed structure and clean it first (in-place rewrite)
+    final_dest = output_filepath or zip_fp
     try:
-        single_root_folder = is_single_root_folder(zip_fp)
-        if single_root_folder:
-            _make_naked(zip_fp, single_root_folder)
+        with zf.ZipFile(zip_fp, 'r') as zf_in:
+            needs_rewrite = _needs_cleaning(zf_in.infolist())
     except zf.BadZipFile:
         logger.error(f"ERROR: Archive is corrupted and cannot be read: {zip_filename}")
         return
 
-    # 2. Iterate and recursively clean nested zips and identify __MACOSX , .DS_Store, and Thumbs.db
-    nested_zips_to_replace: Dict[str, str] = {} # {member_name: path_to_cleaned_temp_zip}
-    needs_rewrite = False
-    
-    try:
-        with zf.ZipFile(zip_fp, 'r') as zf_in:
-            for member in zf_in.infolist():
-                
-                # Check A: __MACOSX (requires rewrite)
-                if True in [i in member.filename for i in SYSTEM_FILES_TO_IGNORE]:
-                    logger.info(f"ISSUE: Found __MACOSX or .DS_Store entry in {zip_filename}: {member.filename}")
-                    needs_rewrite = True 
-                    
-                # Check B: Nested Zip
-                if member.filename.lower().endswith('.zip'):
-                    nested_zip_name = member.filename
-                    needs_rewrite = True # Replacement of a nested zip requires rewrite
-                    
-                    # Create a temporary file to hold the nested zip's stream for cleaning
-                    temp_nested_file = None
-                    try:
-                        temp_nested_file = os.path.join(tempfile.gettempdir(), f"nested_{os.getpid()}_{os.path.basename(nested_zip_name)}")
-                        # Ensure we write the bytes of the nested zip to the temporary file
-                        with open(temp_nested_file, 'wb') as tmp:
-                            tmp.write(zf_in.read(member))
-                        
-                        # Recursively clean the temporary file (in-place on temp_nested_file)
-                        clean_zip_recursively(temp_nested_file)
-                        nested_zips_to_replace[nested_zip_name] = temp_nested_file
-
-                    except Exception as e:
-                        logger.error(f"Failed to clean nested zip {nested_zip_name} inside {zip_filename}: {e}")
-                        # If cleaning fails, we skip replacement and let the uncleaned zip be copied.
-                    
-    except Exception as e:
-        logger.error(f"Unexpected error during recursive scan of {zip_filename}: {e}")
+    if not needs_rewrite:
+        logger.info(f"Nothing to clean in {zip_filename}.")
+        if final_dest != zip_fp:
+            shutil.copyfile(zip_fp, final_dest)
         return
-    
-    # 3. If any changes were detected (MACOSX found or nested zips cleaned), rewrite the main zip.
-    if needs_rewrite:
-        temp_cleaned_zip = None
-        try:
-            # Create a temporary path for the rewritten archive
-            temp_cleaned_zip = os.path.join(tempfile.gettempdir(), f"final_clean_{os.getpid()}_{zip_filename}")
-            
-            # Perform the rewrite (skipping __MACOSX , .DS_Store, and Thumbs.db, replacing nested zips)
-            _rewrite_zip_for_cleaning(zip_fp, temp_cleaned_zip, nested_zips_to_replace)
-            
-            # Replace the original zip file
-            shutil.copyfile(temp_cleaned_zip, zip_fp)
-            logger.debug(f"SUCCESS: Finished cleaning and rewriting {zip_filename}.")
-            
-        except Exception as e:
-            logger.error(f"Failed to finalize rewrite of '{zip_filename}': {e}")
-        finally:
-            # Clean up temporary files
-            if temp_cleaned_zip and os.path.exists(temp_cleaned_zip):
-                 os.remove(temp_cleaned_zip)
-            # Clean up all temporary nested zip files
-            for path in nested_zips_to_replace.values():
-                if os.path.exists(path):
-                    os.remove(path)
 
+    # Replace the destination in a single step, so it is never left half written
+    with helpers.replacing(final_dest, mode_from=zip_fp) as temp_file:
+        _clean_zip_stream(zip_fp, temp_file, max_in_memory, zip_filename)
+    logger.debug(f"SUCCESS: Finished cleaning and rewriting {zip_filename}.")
 
-def main_cleaner(filepath: str, output_filepath: Optional[str] = None, in_place: bool = True):
+
+def convert_to_naked_zip(archive_fp: str, output_filepath: str, max_in_memory: int = DEFAULT_MAX_IN_MEMORY) -> bool:
+    """
+    Converts a rar or tar archive into a cleaned naked zip (see _naked_zip_stream), streamed to a temporary
+    file next to output_filepath, which then atomically replaces it. Returns whether the conversion succeeded.
+    """
+    archive_name = os.path.basename(archive_fp)
+    try:
+        with helpers.replacing(output_filepath, mode_from=archive_fp) as temp_file:
+            _naked_zip_stream(archive_fp, temp_file, max_in_memory)
+    except rarfile.RarCannotExec:
+        logger.error(f"Cannot convert {archive_name}. {UNRAR_MISSING}")
+        return False
+    except (rarfile.Error, tarfile.TarError) as e:
+        logger.error(f"ERROR: Archive is corrupted and cannot be read: {archive_name} ({e})")
+        return False
+    logger.debug(f"SUCCESS: Converted {archive_name} into the naked zip {os.path.basename(output_filepath)}.")
+    return True
+
+
+def main_cleaner(filepath: str, output_filepath: Optional[str] = None, in_place: bool = True,
+                 max_in_memory: int = DEFAULT_MAX_IN_MEMORY):
     """
     Main entry point for recursive cleaning. 
-    It copies the source zip to a temporary file, cleans it, and then moves
-    the result to either the source path (in-place=True) or output_filepath.
+    It streams a cleaned copy of the source zip next to the destination, then moves
+    it to either the source path (in-place=True) or output_filepath.
+    Rar and tar archives are converted into cleaned naked zips (see convert_to_naked_zip).
     
     Args:
-        filepath (str): The path to the source zip file.
+        filepath (str): The path to the source zip, rar or tar file.
         output_filepath (str, optional): The path to save the cleaned file. 
                                          Required if in_place=False.
-        in_place (bool): If True, the original file is overwritten. 
+        in_place (bool): If True, the original file is overwritten (a rar or tar archive
+                         is replaced by a zip with the same name). 
                          If False, the cleaned file is saved to output_filepath.
+        max_in_memory (int): Nested zips up to this size (in bytes) are cleaned in memory,
+                             larger ones in temporary files.
     """
     if not os.path.exists(filepath):
         logger.error(f"File not found: {filepath}")
@@ -472,9 +994,10 @@ def main_cleaner(filepath: str, output_filepath: Optional[str] = None, in_place:
 
     filepath = os.path.abspath(filepath)
     filename = os.path.basename(filepath)
+    ext = getext(filepath)
     
-    if not filename.lower().endswith('.zip'):
-        logger.error(f"Input file must be a zip archive (.zip): {filename}")
+    if ext not in ARCHIVE_SUFFIXES:
+        logger.error(f"Input file must be a zip, rar or tar archive (.zip, .rar, .tar.gz, .tgz, .tar): {filename}")
         return
 
     if not in_place and not output_filepath:
@@ -484,39 +1007,226 @@ def main_cleaner(filepath: str, output_filepath: Optional[str] = None, in_place:
     logger.info(f"--- Starting recursive cleaning of {filename} (In-Place: {in_place}) ---")
     logger.warning("Cleaning of the zip file can take quite some time, please be patient and do not interrupt the script")
     
-    # 1. Create a working copy of the source file in a temporary directory
-    work_fp = os.path.join(tempfile.gettempdir(), f"working_copy_{os.getpid()}_{filename}")
-    
     try:
-        shutil.copyfile(filepath, work_fp)
-        
-        # 2. Perform the recursive cleaning on the working copy
-        clean_zip_recursively(work_fp)
-        
-        # 3. Determine the final destination
-        final_dest = filepath if in_place else output_filepath
-        
-        # 4. Move the cleaned working copy to the final destination
-        if os.path.exists(final_dest):
-            os.remove(final_dest) # Remove existing file before renaming/moving
-        shutil.move(work_fp, final_dest)
+        # Determine the final destination and clean the source into it
+        if ext == "zip":
+            final_dest = filepath if in_place else os.path.abspath(output_filepath)
+            clean_zip_recursively(filepath, output_filepath=final_dest, max_in_memory=max_in_memory)
+        else:
+            final_dest = f"{filepath[:-(len(ext) + 1)]}.zip" if in_place else os.path.abspath(output_filepath)
+            if in_place and os.path.exists(final_dest):
+                logger.error(f"{os.path.basename(final_dest)} already exists, use an output filepath to convert {filename}.")
+                return
+            if not convert_to_naked_zip(filepath, final_dest, max_in_memory=max_in_memory):
+                return
+            if in_place:
+                os.remove(filepath)
         
-        if in_place:
+        if in_place and ext != "zip":
+            logger.info(f"--- Cleaning complete: {filename} was replaced by {os.path.basename(final_dest)}. ---")
+        elif in_place:
             logger.info(f"--- Cleaning complete: {filename} was cleaned in-place. ---")
         else:
             logger.info(f"--- Cleaning complete: Saved cleaned file to {os.path.basename(final_dest)} ---")
             
     except Exception as e:
         logger.error(f"An error occurred during cleanup of {filename}: {e}")
-        
-    finally:
-        # Clean up the temporary working file if it still exists
-        if os.path.exists(work_fp):
-            os.remove(work_fp)
 
 
+def _folder_members(source_path):
+    """Lists the (path, arcname) of the files to zip in a folder, in a deterministic order."""
+    members = []
+    # os.walk is used to iterate recursively inside the folder
+    for root, dirs, files in os.walk(source_path):
+        dirs.sort()
+        for file in sorted(files):
+            
+            # Skip system files found inside subfolders
+            if file in SYSTEM_FILES_TO_IGNORE:
+                logger.info(f"  Skipping nested system file '{file}' in {root}")
+                continue
+            
+            full_path = os.path.join(root, file)
+            # Key part for 'naked' zipping: arcname is relative to source_path,
+            # flattening the top-level folder structure inside the zip.
+            members.append((full_path, os.path.relpath(full_path, source_path)))
+    return members
+
+
+def _unchanged_member(previous: zf.ZipFile, full_path: str, arcname: str, verify_crc: bool = False):
+    """
+    Returns the member of a previous zip holding the same content as full_path, judging by its size
+    and modification time (and CRC with verify_crc), or None if the file is new or changed.
+    """
+    try:
+        old_info = previous.getinfo(arcname)
+    except KeyError:
+        return None
+    stat = os.stat(full_path)
+    date_time = time.localtime(stat.st_mtime)[:6]
+    # Zip timestamps have a 2 second resolution
+    if (old_info.file_size != stat.st_size or old_info.date_time[:5] != date_time[:5]
+            or old_info.date_time[5] // 2 != date_time[5] // 2):
+        return None
+    if verify_crc:
+        crc = 0
+        with open(full_path, 'rb') as f:
+            while chunk := f.read(CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+        if crc != old_info.CRC:
+            return None
+    return old_info
+
 
-def zip_appropriately(source_dir: str, target_dir: str):
+def _zip_folder(source_path: str, zip_fp: str, pool: Optional[ThreadPoolExecutor] = None,
+                slots: Optional[threading.Semaphore] = None,
+                compression: int = zf.ZIP_DEFLATED, level: Optional[int] = None,
+                incremental: bool = False, verify_crc: bool = False,
+                hash_content: bool = False, previous_hashes: Optional[Dict[str, tuple]] = None):
+    """
+    Zips the content of source_path into the naked zip zip_fp, with the compression and level given
+    for the files that choose_compression does not store as they are.
+    With a pool, members are compressed ahead in its threads while they are appended to the zip in order,
+    each member compressed ahead taking one of the slots, shared by the folders zipped at the same time
+    to bound the memory their compressed data take.
+    With incremental, the members of an existing zip_fp whose file is unchanged (see _unchanged_member)
+    are copied from it without being recompressed, and the new zip then replaces it; an existing zip_fp
+    holding exactly the files of source_path, all unchanged, is kept as it is.
+    With hash_content, returns the manifest rows (path, size, sha256) of the zip, hashing each file
+    in the pass that compresses it; reused files take their hash from previous_hashes
+    (the manifest of the previous run) when available, and are read again otherwise.
+    """
+    item_name = os.path.basename(source_path)
+    previous_hashes = previous_hashes or {}
+    hashes = {}
+
+    def reused_hash(full_path, old_info):
+        if not hash_content:
+            return None
+        size, sha256 = previous_hashes.get(old_info.filename, (None, None))
+        return sha256 if size == old_info.file_size else _file_sha256(full_path)
+
+    try:
+        members = _folder_members(source_path)
+        exists = os.path.isfile(zip_fp)
+        # {arcname: member of the previous zip}, for the files that are unchanged
+        unchanged = {}
+        compared = False
+        if incremental and exists:
+            try:
+                with zf.ZipFile(zip_fp, 'r') as previous:
+                    for full_path, arcname in members:
+                        if old_info := _unchanged_member(previous, full_path, arcname, verify_crc):
+                            unchanged[arcname] = old_info
+                    previous_names = previous.namelist()
+                compared = True
+            except zf.BadZipFile:
+                logger.warning(f"  Previous '{item_name}.zip' cannot be read, zipping it from scratch")
+            if compared and len(unchanged) == len(members) and previous_names == [arcname for _, arcname in members]:
+                logger.info(f"  '{item_name}.zip': all {len(members)} files unchanged, kept as it is")
+                if hash_content:
+                    return [(arcname, unchanged[arcname].file_size, reused_hash(full_path, unchanged[arcname]))
+                            for full_path, arcname in members]
+                return None
+
+        with ExitStack() as stack:
+            previous = None
+            # Entered first, so that the zip is closed (and any previous one too) before taking the place of zip_fp,
+            # which is never left half written
+            target = stack.enter_context(helpers.replacing(zip_fp, mode_from=zip_fp if exists else None))
+            if unchanged:
+                previous = stack.enter_context(zf.ZipFile(zip_fp, 'r'))
+            zf_out = stack.enter_context(zf.ZipFile(target, 'w', compression, compresslevel=level))
+            reused = 0
+
+            if pool is None:
+                for full_path, arcname in members:
+                    if old_info := unchanged.get(arcname):
+                        copy_member_raw(previous, old_info, zf_out)
+                        hashes[arcname] = reused_hash(full_path, old_info)
+                        reused += 1
+                        continue
+                    hashes[arcname] = _write_member(zf_out, full_path, arcname, compression, level, hash_content)
+            else:
+                slots = slots or threading.Semaphore(1)
+                in_flight = deque()
+
+                def append(item):
+                    if isinstance(item[1], zf.ZipInfo):
+                        full_path, old_info = item
+                        copy_member_raw(previous, old_info, zf_out)
+                        hashes[old_info.filename] = reused_hash(full_path, old_info)
+                        return
+                    try:
+                        info, compressed, sha256 = item[1].result()
+                    finally:
+                        slots.release()
+                    with compressed:
+                        write_member_raw(zf_out, info, compressed)
+                    hashes[info.filename] = sha256
+
+                def reserve():
+                    # Members of this zip are appended while waiting for a slot, so that the zips being
+                    # built never all wait for each other while holding slots
+                    while not slots.acquire(blocking=False):
+                        if not in_flight:
+                            slots.acquire()
+                            return
+                        append(in_flight.popleft())
+
+                try:
+                    for full_path, arcname in members:
+                        if old_info := unchanged.get(arcname):
+                            in_flight.append((full_path, old_info))
+                            reused += 1
+                            continue
+                        reserve()
+                        in_flight.append((full_path, pool.submit(_compress_member, full_path, arcname,
+                                                                  compression, level, hash_content)))
+                    while in_flight:
+                        append(in_flight.popleft())
+                finally:
+                    # After an error, frees the slots (and the compressed data) of the members not appended
+                    for _, future in in_flight:
+                        if isinstance(future, zf.ZipInfo):
+                            continue
+                        if not future.cancel() and future.exception() is None:
+                            future.result()[1].close()
+                        slots.release()
+            if hash_content:
+                rows = [(info.filename, info.file_size, hashes[info.filename]) for info in zf_out.infolist()]
+        if compared:
+            logger.info(f"  '{item_name}.zip': reused {reused} unchanged of {len(members)} files")
+        return rows if hash_content else None
+    except Exception as e:
+        logger.error(f"Failed to create zip for {item_name}: {e}")
+        return None
+
+
+def _write_dedup_report(report_fp: str, manifests: Dict[str, list]):
+    """
+    Writes the files found more than once across the produced zips (same sha256 and size) to a csv,
+    one row per copy, and logs how much space the duplicates take.
+    """
+    copies = {}
+    for zip_name, rows in manifests.items():
+        for path, size, sha256 in rows:
+            copies.setdefault((sha256, size), []).append((zip_name, path))
+    duplicates = {key: locations for key, locations in copies.items() if len(locations) > 1}
+    with open(report_fp, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(('sha256', 'size', 'copies', 'zip', 'path'))
+        for (sha256, size), locations in sorted(duplicates.items(), key=lambda item: -item[0][1] * len(item[1])):
+            writer.writerows((sha256, size, len(locations), zip_name, path) for zip_name, path in locations)
+    redundant = sum(size * (len(locations) - 1) for (_, size), locations in duplicates.items())
+    logger.info(f"--- Duplicates: {len(duplicates)} files stored more than once, "
+                f"{redundant / 1e6:.2f} MB redundant, see {os.path.basename(report_fp)} ---")
+
+
+def zip_appropriately(source_dir: str, target_dir: str, jobs: int = 1,
+                      compression: int = zf.ZIP_DEFLATED, level: Optional[int] = None,
+                      incremental: bool = False, verify_crc: bool = False,
+                      manifest: bool = False, dedup_report: Optional[str] = None):
     """
     Creates a copy of the source directory structure in the target directory,
     where:
@@ -524,59 +1234,110 @@ def zip_appropriately(source_dir: str, target_dir: str):
     2. Any loose files in the source root are copied directly to the target root.
     
     System files like .DS_Store are excluded from both zipping and copying.
+    With jobs > 1, up to jobs zips are built at the same time, and the files of each
+    folder are compressed in jobs threads before being appended to its zip in order.
+    Files are compressed with compression (one of COMPRESSIONS) at the given level, except
+    for already compressed payloads, which are stored (see choose_compression).
+    With incremental, the target directory of a previous run is updated rather than recreated:
+    unchanged files are reused from the previous zips and loose files are only copied when changed,
+    while entries whose source no longer exists are removed.
+    With manifest, a <folder>.manifest.csv listing the path, size and sha256 of each member is written next
+    to each zip. With dedup_report, the files present more than once across all zips are written to that csv.
     """
     
+    if level is not None and compression in COMPRESSION_LEVELS and level not in COMPRESSION_LEVELS[compression]:
+        raise ValueError(f"Compression level {level} is not supported by {zf.compressor_names[compression]}")
     if not os.path.isdir(source_dir):
         logger.error(f"Source directory not found: {source_dir}")
         return
 
     # Create the target directory, overwriting if it exists to ensure a clean slate
-    if os.path.exists(target_dir):
+    if os.path.exists(target_dir) and not incremental:
         shutil.rmtree(target_dir)
     os.makedirs(target_dir, exist_ok=True)
     
     logger.info(f"--- Starting naked zipping of '{os.path.basename(source_dir)}' to '{os.path.basename(target_dir)}' ---")
 
-    for item_name in os.listdir(source_dir):
-        source_path = os.path.join(source_dir, item_name)
+    produced = set()
+    hash_content = manifest or bool(dedup_report)
+    manifests = {}
+    # {item_name: manifest of the previous run}, so that manifests listing the same files are not rewritten
+    previous_manifests = {}
+    zip_futures = {}
+    with ExitStack() as stack:
+        if jobs > 1:
+            # Folders and members get separate pools, as folder threads wait on member threads
+            folder_pool = stack.enter_context(ThreadPoolExecutor(max_workers=jobs))
+            member_pool = stack.enter_context(ThreadPoolExecutor(max_workers=jobs))
+            # Members compressed ahead, across all the zips being built, enough to keep the threads busy
+            slots = threading.Semaphore(2 * jobs)
 
-        # Skip system files found at the root level (covers both folders and loose files)
-        if item_name in SYSTEM_FILES_TO_IGNORE:
-            logger.info(f"  Skipping root system entry '{item_name}'")
-            continue
-        
-        if os.path.isdir(source_path):
-            # 1. Handle Folders: Create a naked zip file
-            zip_fp = os.path.join(target_dir, f"{item_name}.zip")
-            logger.info(f"  Zipping folder '{item_name}/' -> '{item_name}.zip' (naked)")
+        for item_name in sorted(os.listdir(source_dir)):
+            source_path = os.path.join(source_dir, item_name)
+
+            # Skip system files found at the root level (covers both folders and loose files)
+            if item_name in SYSTEM_FILES_TO_IGNORE:
+                logger.info(f"  Skipping root system entry '{item_name}'")
+                continue
             
-            try:
-                with zf.ZipFile(zip_fp, 'w', zf.ZIP_DEFLATED) as zf_out:
-                    # os.walk is used to iterate recursively inside the folder
-                    for root, _, files in os.walk(source_path):
-                        for file in files:
-                            
-                            # Skip system files found inside subfolders
-                            if file in SYSTEM_FILES_TO_IGNORE:
-                                logger.info(f"  Skipping nested system file '{file}' in {root}")
-                                continue
-                            
-                            full_path = os.path.join(root, file)
-                            # Key part for 'naked' zipping: arcname is relative to source_path,
-                            # flattening the top-level folder structure inside the zip.
-                            arcname = os.path.relpath(full_path, source_path)
-                            zf_out.write(full_path, arcname)
-            except Exception as e:
-                logger.error(f"Failed to create zip for {item_name}: {e}")
-
-        elif os.path.isfile(source_path):
-            # 2. Handle Files: Copy free file
-            target_path = os.path.join(target_dir, item_name)
-            logger.info(f"  Copying file '{item_name}'")
-            try:
-                shutil.copy2(source_path, target_path) # copy2 preserves metadata
-            except Exception as e:
-                logger.error(f"Failed to copy file {item_name}: {e}")
+            if os.path.isdir(source_path):
+                # 1. Handle Folders: Create a naked zip file
+                zip_fp = os.path.join(target_dir, f"{item_name}.zip")
+                produced.add(f"{item_name}.zip")
+                logger.info(f"  Zipping folder '{item_name}/' -> '{item_name}.zip' (naked)")
+                manifest_fp = os.path.join(target_dir, f"{item_name}{MANIFEST_SUFFIX}")
+                previous_hashes = read_manifest(manifest_fp) if incremental and os.path.isfile(manifest_fp) else None
+                previous_manifests[item_name] = previous_hashes
+                if manifest:
+                    produced.add(f"{item_name}{MANIFEST_SUFFIX}")
+                options = dict(compression=compression, level=level, incremental=incremental, verify_crc=verify_crc,
+                               hash_content=hash_content, previous_hashes=previous_hashes)
+                if jobs > 1:
+                    zip_futures[item_name] = folder_pool.submit(_zip_folder, source_path, zip_fp,
+                                                                pool=member_pool, slots=slots, **options)
+                else:
+                    manifests[item_name] = _zip_folder(source_path, zip_fp, **options)
+
+            elif os.path.isfile(source_path):
+                # 2. Handle Files: Copy free file
+                target_path = os.path.join(target_dir, item_name)
+                produced.add(item_name)
+                if incremental and os.path.isfile(target_path):
+                    source_stat, target_stat = os.stat(source_path), os.stat(target_path)
+                    if (source_stat.st_size, source_stat.st_mtime_ns) == (target_stat.st_size, target_stat.st_mtime_ns):
+                        logger.debug(f"  File '{item_name}' is unchanged")
+                        continue
+                logger.info(f"  Copying file '{item_name}'")
+                try:
+                    shutil.copy2(source_path, target_path) # copy2 preserves metadata
+                except Exception as e:
+                    logger.error(f"Failed to copy file {item_name}: {e}")
+
+        for item_name, future in zip_futures.items():
+            manifests[item_name] = future.result()
+
+    # Zips that failed have no manifest
+    manifests = {f"{item_name}.zip": rows for item_name, rows in manifests.items() if rows is not None}
+    if manifest:
+        for zip_name, rows in manifests.items():
+            item_name = zip_name[:-len('.zip')]
+            if previous_manifests.get(item_name) == {path: (size, sha256) for path, size, sha256 in rows}:
+                continue
+            _write_manifest(os.path.join(target_dir, f"{item_name}{MANIFEST_SUFFIX}"), rows)
+    if dedup_report:
+        _write_dedup_report(dedup_report, manifests)
+        if os.path.dirname(os.path.abspath(dedup_report)) == os.path.abspath(target_dir):
+            produced.add(os.path.basename(dedup_report))
+
+    if incremental:
+        # Remove what a previous run produced from sources that are gone
+        for item_name in sorted(set(os.listdir(target_dir)) - produced):
+            logger.info(f"  Removing '{item_name}', which is no longer in the source")
+            stale_path = os.path.join(target_dir, item_name)
+            if os.path.isdir(stale_path):
+                shutil.rmtree(stale_path)
+            else:
+                os.remove(stale_path)
         
     logger.info("--- Naked zipping process complete ---")
 
@@ -606,13 +1367,14 @@ def cli():
     # --- 'clean' command parser ---
     parser_clean = subparsers.add_parser(
         'clean',
-        help='Recursively cleans a zip file, removing system files and redundant single-root wrapping folder.',
+        help='Recursively cleans a zip file, removing system files and redundant single-root wrapping folder.\n'
+             'Rar and tar archives are converted into cleaned naked zips.',
         formatter_class=argparse.RawTextHelpFormatter
     )
     parser_clean.add_argument(
         'filepath',
         type=str,
-        help='Path to the zip file to be cleaned.'
+        help='Path to the zip file to be cleaned (or the rar/tar archive to be converted).'
     )
     parser_clean.add_argument(
         '--output-filepath',
@@ -624,7 +1386,14 @@ def cli():
         '--in-place',
         action='store_true',
         default=False,
-        help="""Clean the file in place, i.e. overwrite the zip file."""
+        help="""Clean the file in place, i.e. overwrite the zip file.
+A rar/tar archive is replaced by a zip with the same name."""
+    )
+    parser_clean.add_argument(
+        '--max-in-memory-mb',
+        type=int,
+        default=DEFAULT_MAX_IN_MEMORY // (1024 * 1024),
+        help="""Nested zips up to this size are cleaned in memory, larger ones in temporary files (default: 64)."""
     )
     # Set the function to call when 'clean' is used
     parser_clean.set_defaults(func=handle_clean_command)
@@ -644,6 +1413,47 @@ def cli():
         type=str,
         help='Path to the target directory where the resulting files and zips will be saved.'
     )
+    parser_zip.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=1,
+        help='Number of zips to build, and of files to compress per zip, in parallel (default: 1).'
+    )
+    parser_zip.add_argument(
+        '--compression',
+        choices=list(COMPRESSIONS),
+        default='deflated',
+        help='Compression of the files that are not already compressed, which are always stored (default: deflated).'
+    )
+    parser_zip.add_argument(
+        '--level',
+        type=int,
+        choices=range(10),
+        metavar='0-9',
+        default=None,
+        help='Compression level (default: the default of the chosen compression; bzip2 requires 1-9).'
+    )
+    parser_zip.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Update the zips of a previous run in target_dir, reusing the files whose size and modification time are unchanged (they keep their previous compression).'
+    )
+    parser_zip.add_argument(
+        '--verify-crc',
+        action='store_true',
+        help='With --incremental, also compare the CRC of the files before reusing them.'
+    )
+    parser_zip.add_argument(
+        '--manifest',
+        action='store_true',
+        help='Write next to each zip a <name>.manifest.csv with the path, size and sha256 of its files, hashed while compressing them.'
+    )
+    parser_zip.add_argument(
+        '--dedup-report',
+        type=str,
+        default=None,
+        help='Write to this csv the files that are byte-identical across all the produced zips.'
+    )
     # --- 'extract' command parser ---
     parser_extract = subparsers.add_parser(
         'extract',
@@ -659,6 +1469,12 @@ def cli():
         action='store_true',
         help='Deletes the source compressed files after successful extraction.'
     )
+    parser_extract.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=1,
+        help='Number of archives to extract in parallel (default: 1).'
+    )
     parser_extract.set_defaults(func=handle_extract_command)
     # Set the function to call when 'naked' is used
     parser_zip.set_defaults(func=handle_zip_command)
@@ -690,16 +1506,28 @@ def handle_clean_command(args):
         # If both are specified, prioritize the explicit output path
         logger.info("You specified an output path but also '--in-place', the output path will be used.")
         in_place = False
-    main_cleaner(args.filepath, output_filepath=output_filepath, in_place=in_place)
+    main_cleaner(args.filepath, output_filepath=output_filepath, in_place=in_place,
+                 max_in_memory=args.max_in_memory_mb * 1024 * 1024)
 
 
 def handle_zip_command(args):
     """Handler function for the 'zip' command."""
-    zip_appropriately(args.source_dir, args.target_dir)
+    compression = COMPRESSIONS[args.compression]
+    if args.level is not None:
+        if compression not in COMPRESSION_LEVELS:
+            logger.warning(f"'--level' is ignored by the {args.compression} compression.")
+        elif args.level not in COMPRESSION_LEVELS[compression]:
+            levels = COMPRESSION_LEVELS[compression]
+            logger.error(f"Error: the {args.compression} compression requires a '--level' from {levels[0]} to {levels[-1]}.")
+            return
+    zip_appropriately(args.source_dir, args.target_dir, jobs=args.jobs,
+                      compression=compression, level=args.level,
+                      incremental=args.incremental, verify_crc=args.verify_crc,
+                      manifest=args.manifest, dedup_report=args.dedup_report)
 
 def handle_extract_command(args):
     """Handler function for the 'extract' command."""
-    extract_recursively(args.path, args.remove_archives)
+    extract_recursively(args.path, args.remove_archives, jobs=args.jobs)
 
 
 if __name__ == '__main__':
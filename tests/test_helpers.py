@@ -0,0 +1,39 @@
+import os
+import stat
+
+import pytest
+
+from nccr_cat_scripts import helpers
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_replacing_new_file_gets_default_mode(tmp_path):
+    dest = tmp_path / "out.bin"
+    with helpers.replacing(dest) as f:
+        f.write(b"data")
+    assert dest.read_bytes() == b"data"
+    assert _mode(dest) == 0o666 & ~helpers.current_umask()
+
+
+def test_replacing_keeps_mode_from(tmp_path):
+    dest = tmp_path / "out.bin"
+    dest.write_bytes(b"old")
+    os.chmod(dest, 0o640)
+    with helpers.replacing(dest, mode_from=dest, durable=True) as f:
+        f.write(b"new")
+    assert dest.read_bytes() == b"new"
+    assert _mode(dest) == 0o640
+
+
+def test_replacing_leaves_dest_untouched_on_error(tmp_path):
+    dest = tmp_path / "out.bin"
+    dest.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with helpers.replacing(dest) as f:
+            f.write(b"partial")
+            raise RuntimeError
+    assert dest.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["out.bin"]
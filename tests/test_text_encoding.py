@@ -0,0 +1,59 @@
+import codecs
+
+import pytest
+
+from nccr_cat_scripts.text_encoding import (
+    EncodingCache, EncodingMismatchError, classify_encoding, decode_scientific, write_utf8,
+)
+
+
+def test_cache_copies_ignore_target_encoding(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("plain ascii\n")
+    cache = EncodingCache(str(tmp_path / "cache.sqlite"))
+    cache.store("data.txt", str(path), "ascii", False, "copy", enc="latin-1")
+    assert cache.lookup("data.txt", str(path), "copy", enc="cp1252") == ("ascii", False)
+    assert cache.lookup("data.txt", str(path), "convert", enc="latin-1") is None
+
+    cache.store("data.txt", str(path), "latin-1", True, "convert", enc="latin-1")
+    assert cache.lookup("data.txt", str(path), "convert", enc="latin-1") == ("latin-1", True)
+    assert cache.lookup("data.txt", str(path), "convert", enc="cp1252") is None
+    cache.close()
+
+
+@pytest.mark.parametrize("bom,text,codec", [
+    (codecs.BOM_UTF16_LE, "‰‰″", "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "‰‰″", "utf-16-be"),
+    (codecs.BOM_UTF8, "µ°é", "utf-8"),
+])
+def test_bom_wins_over_histogram(tmp_path, bom, text, codec):
+    # No null byte at all: only the BOM tells UTF-16 from latin-1
+    path = tmp_path / "data.txt"
+    path.write_bytes(bom + text.encode(codec))
+    encoding, _ = classify_encoding(str(path))
+    assert encoding == ("utf-8-sig" if codec == "utf-8" else "utf-16")
+
+
+TEXT = "Temperature: 25 °C, µ = 1.5 ± 0.1, α-phase, ∑ Ω\n" * 50
+
+
+@pytest.mark.parametrize("codec", ["utf-8", "latin-1", "cp1252", "utf-16"])
+@pytest.mark.parametrize("chunk_size", [2, 3, 7, 4096])
+def test_streaming_detection_and_conversion(tmp_path, codec, chunk_size):
+    # Small chunks split multibyte characters and UTF-16 code units across reads
+    text = TEXT if codec in ("utf-8", "utf-16") else TEXT.replace("α", "a").replace("∑ Ω", "").replace("±", "+/-")
+    path = tmp_path / "data.txt"
+    path.write_bytes(text.encode(codec))
+
+    encoding = decode_scientific(str(path), chunk_size=chunk_size)
+    assert text.encode(encoding) == text.encode(codec)
+    write_utf8(str(path), str(tmp_path / "out.txt"), encoding, chunk_size=chunk_size)
+    assert (tmp_path / "out.txt").read_bytes() == text.encode("utf-8")
+
+
+def test_given_encoding_mismatch_raises(tmp_path):
+    path = tmp_path / "data.txt"
+    # Decodes as cp1252, but the euro sign is outside of the scientific character set
+    path.write_bytes(b"price: 10 \x80\n" * 10)
+    with pytest.raises(EncodingMismatchError):
+        decode_scientific(str(path), enc="cp1252", chunk_size=4)
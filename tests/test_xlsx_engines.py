@@ -0,0 +1,67 @@
+import re
+import zipfile as zf
+
+import openpyxl
+import pytest
+
+from nccr_cat_scripts.tabular_utils import unpad_strip_xlsx_file, unpad_strip_xlsx_xml
+
+CONTROL = (
+    '<controls><control shapeId="1025" r:id="rId9" name="Button"><controlPr defaultSize="0">'
+    '<anchor moveWithCells="1"><from><xdr:col>4</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>5</xdr:row>'
+    '<xdr:rowOff>0</xdr:rowOff></from><to><xdr:col>6</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>8</xdr:row>'
+    '<xdr:rowOff>0</xdr:rowOff></to></anchor></controlPr></control></controls>'
+)
+
+
+def _padded_workbook(path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws["C3"], ws["D3"] = "  name ", "value"
+    for n in range(4, 10):
+        ws[f"C{n}"], ws[f"D{n}"] = f" item {n} ", n
+    ws["E4"] = "=SUM(D4:D9)"
+    ws.merge_cells("C10:D10")
+    other = wb.create_sheet("Other")
+    other["B2"] = "=Data!D5*2"
+    wb.save(path)
+
+
+def _values(path):
+    wb = openpyxl.load_workbook(path)
+    # openpyxl may leave empty rows and columns in the sheet dimensions, so only the filled cells are compared
+    return {(ws.title, cell.coordinate): cell.value for ws in wb for row in ws.iter_rows() for cell in row
+            if cell.value is not None}
+
+
+@pytest.mark.parametrize("unpad,strip_text", [(True, True), (True, False), (False, True)])
+def test_xml_engine_matches_openpyxl(tmp_path, unpad, strip_text):
+    source = tmp_path / "source.xlsx"
+    _padded_workbook(source)
+    assert unpad_strip_xlsx_file(str(source), str(tmp_path / "openpyxl.xlsx"), unpad, strip_text)
+    assert unpad_strip_xlsx_xml(str(source), str(tmp_path / "xml.xlsx"), unpad, strip_text)
+    assert _values(tmp_path / "xml.xlsx") == _values(tmp_path / "openpyxl.xlsx")
+    merged = openpyxl.load_workbook(tmp_path / "xml.xlsx")["Data"].merged_cells.ranges
+    assert [str(r) for r in merged] == ["A8:B8" if unpad else "C10:D10"]
+
+
+def test_xml_engine_shifts_control_anchors(tmp_path):
+    source, padded = tmp_path / "source.xlsx", tmp_path / "padded.xlsx"
+    _padded_workbook(padded)
+    with zf.ZipFile(padded) as zin, zf.ZipFile(source, "w") as zout:
+        for info in zin.infolist():
+            data = zin.read(info)
+            if info.filename == "xl/worksheets/sheet1.xml":
+                text = data.decode().replace(
+                    "<worksheet ",
+                    '<worksheet xmlns:xdr="http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing" ', 1)
+                data = text.replace("</worksheet>", f"{CONTROL}</worksheet>").encode()
+            zout.writestr(info, data)
+
+    assert unpad_strip_xlsx_xml(str(source), str(tmp_path / "out.xlsx"), True, False)
+    with zf.ZipFile(tmp_path / "out.xlsx") as z:
+        sheet = z.read("xl/worksheets/sheet1.xml").decode()
+    # Padding of 2 rows and 2 columns: anchors count from 0, the sheet rows are not affected by them
+    assert re.findall(r"<xdr:(row|col)>(\d+)<", sheet) == [("col", "2"), ("row", "3"), ("col", "4"), ("row", "6")]
+    assert re.findall(r'<row r="(\d+)"', sheet) == [str(n) for n in range(1, 9)]
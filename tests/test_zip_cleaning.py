@@ -0,0 +1,71 @@
+import io
+import os
+import tarfile
+import zipfile as zf
+
+from nccr_cat_scripts.zip_utils import main_cleaner
+
+
+def _zip_bytes(members):
+    buffer = io.BytesIO()
+    with zf.ZipFile(buffer, "w", zf.ZIP_DEFLATED) as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return buffer.getvalue()
+
+
+NESTED = _zip_bytes({"inner/a.txt": b"a" * 1000, "__MACOSX/inner/._a.txt": b"x"})
+CLEAN_NESTED = _zip_bytes({"b.txt": b"b" * 1000})
+
+
+def _check_cleaned(path):
+    with zf.ZipFile(path) as z:
+        assert z.testzip() is None
+        assert sorted(z.namelist()) == ["clean.zip", "docs/", "docs/readme.txt", "nested.zip", "values.csv"]
+        assert z.read("values.csv") == b"1,2,3\n" * 1000
+        assert z.getinfo("nested.zip").compress_type == zf.ZIP_STORED
+        with zf.ZipFile(io.BytesIO(z.read("nested.zip"))) as nested:
+            assert nested.namelist() == ["a.txt"]
+            assert nested.read("a.txt") == b"a" * 1000
+        # Nested zips needing no cleaning are kept as they are
+        assert z.read("clean.zip") == CLEAN_NESTED
+
+
+def test_clean_zip_round_trip(tmp_path):
+    source = tmp_path / "source.zip"
+    with zf.ZipFile(source, "w", zf.ZIP_DEFLATED) as z:
+        z.writestr("root/", b"")
+        z.writestr("root/docs/", b"")
+        z.writestr("root/docs/readme.txt", b"hello")
+        z.writestr("root/values.csv", b"1,2,3\n" * 1000)
+        z.writestr("root/.DS_Store", b"junk")
+        z.writestr("root/nested.zip", NESTED)
+        z.writestr("root/clean.zip", CLEAN_NESTED)
+
+    main_cleaner(str(source), str(tmp_path / "cleaned.zip"), in_place=False)
+    _check_cleaned(tmp_path / "cleaned.zip")
+    # Unchanged members are copied without being recompressed
+    with zf.ZipFile(source) as before, zf.ZipFile(tmp_path / "cleaned.zip") as after:
+        old, new = before.getinfo("root/values.csv"), after.getinfo("values.csv")
+        assert (new.CRC, new.compress_size, new.compress_type) == (old.CRC, old.compress_size, old.compress_type)
+
+
+def test_tar_converted_to_naked_zip(tmp_path):
+    source = tmp_path / "source.tar.gz"
+    with tarfile.open(source, "w:gz") as t:
+        for name in ("root", "root/docs"):
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            t.addfile(info)
+        for name, data in {"root/docs/readme.txt": b"hello", "root/values.csv": b"1,2,3\n" * 1000,
+                           "root/.DS_Store": b"junk", "root/nested.zip": NESTED, "root/clean.zip": CLEAN_NESTED}.items():
+            info = tarfile.TarInfo(name)
+            info.size, info.mtime = len(data), 1_600_000_000
+            t.addfile(info, io.BytesIO(data))
+        link = tarfile.TarInfo("root/link")
+        link.type, link.linkname = tarfile.SYMTYPE, "values.csv"
+        t.addfile(link)
+
+    main_cleaner(str(source), in_place=True)
+    assert os.listdir(tmp_path) == ["source.zip"]
+    _check_cleaned(tmp_path / "source.zip")
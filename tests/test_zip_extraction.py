@@ -0,0 +1,101 @@
+import io
+import logging
+import os
+import tarfile
+import zipfile as zf
+
+import pytest
+
+from nccr_cat_scripts.zip_utils import ArchiveIndex, _extract_archive, extract_recursively_in_folder
+
+
+def _write_zip(path, members):
+    with zf.ZipFile(path, "w") as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+
+
+def test_parallel_extraction_into_shared_root(tmp_path):
+    # Every archive unwraps its single root folder into tmp_path, so all of them write into data/
+    expected = set()
+    for i in range(12):
+        members = {f"data/sub{j}/deep/file_{i}_{j}.txt": f"{i}-{j}" for j in range(20)}
+        _write_zip(tmp_path / f"archive_{i}.zip", members)
+        expected.update(members)
+
+    extract_recursively_in_folder(str(tmp_path), remove_archives=True, jobs=8)
+
+    found = {
+        os.path.relpath(os.path.join(root, name), tmp_path).replace(os.sep, "/")
+        for root, _, names in os.walk(tmp_path)
+        for name in names
+    }
+    assert found == expected
+
+
+def test_parallel_extraction_of_nested_archives(tmp_path):
+    expected = set()
+    for i in range(6):
+        inner = tmp_path / f"inner_{i}.zip"
+        members = {f"data/nested/file_{i}_{j}.txt": f"{i}-{j}" for j in range(10)}
+        _write_zip(inner, members)
+        _write_zip(tmp_path / f"outer_{i}.zip", {f"data/inner_{i}.zip": inner.read_bytes()})
+        inner.unlink()
+        expected.update(f"data/{name}" for name in members)
+
+    extract_recursively_in_folder(str(tmp_path), remove_archives=True, jobs=4)
+
+    found = {
+        os.path.relpath(os.path.join(root, name), tmp_path).replace(os.sep, "/")
+        for root, _, names in os.walk(tmp_path)
+        for name in names
+    }
+    assert found == expected
+
+
+def _write_tar(path, entries):
+    """entries are (name, content) pairs, content being bytes for files and ("symlink", target) for links."""
+    with tarfile.open(path, "w:gz") as t:
+        for name, content in entries:
+            info = tarfile.TarInfo(name)
+            if isinstance(content, tuple):
+                info.type, info.linkname = tarfile.SYMTYPE, content[1]
+                t.addfile(info)
+            else:
+                info.size = len(content)
+                t.addfile(info, io.BytesIO(content))
+
+
+def test_zipslip_zip_rejected(tmp_path):
+    _write_zip(tmp_path / "evil.zip", {"ok.txt": "ok", "../escaped.txt": "out"})
+
+    with pytest.raises(Exception, match="ZipSlip"):
+        _extract_archive(str(tmp_path / "evil.zip"))
+    assert not (tmp_path.parent / "escaped.txt").exists()
+    assert not (tmp_path / "evil" / "ok.txt").exists()
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_zipslip_tar_symlink_rejected(tmp_path, caplog, cached):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    root = tmp_path / "root"
+    root.mkdir()
+    tar_fp = str(root / "evil.tar.gz")
+    _write_tar(tar_fp, [
+        ("data/first.txt", b"in"),
+        ("data/link", ("symlink", "../../outside")),
+        ("data/link/pwned.txt", b"out"),
+    ])
+    if cached:
+        ArchiveIndex.read(tar_fp)
+
+    with caplog.at_level(logging.ERROR), pytest.raises(Exception, match="ZipSlip"):
+        _extract_archive(tar_fp)
+    assert os.listdir(outside) == []
+    assert "data/link" in caplog.text
+    # Only member names are reported, not the private extraction folder
+    assert ".evil.tar.gz." not in caplog.text
+    if cached:
+        # Validated up front: nothing was extracted
+        assert sorted(os.listdir(root)) == ["evil.tar.gz"]
@@ -0,0 +1,68 @@
+import os
+import random
+import zipfile as zf
+
+import pytest
+
+from nccr_cat_scripts.zip_utils import COMPRESSIONS, choose_compression, zip_appropriately
+
+
+def _make_source(root):
+    for i in range(5):
+        folder = root / "folder" / f"sub{i % 2}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"file{i}.txt").write_text(f"content {i}\n" * 100)
+
+
+def test_incremental_keeps_unchanged_zip_and_manifest(tmp_path):
+    source, target = tmp_path / "source", tmp_path / "target"
+    _make_source(source)
+    zip_appropriately(str(source), str(target), incremental=True, manifest=True)
+    zip_fp, manifest_fp = target / "folder.zip", target / "folder.manifest.csv"
+    before = {fp: os.stat(fp) for fp in (zip_fp, manifest_fp)}
+
+    zip_appropriately(str(source), str(target), incremental=True, manifest=True)
+    for fp, stat in before.items():
+        after = os.stat(fp)
+        assert (after.st_ino, after.st_mtime_ns) == (stat.st_ino, stat.st_mtime_ns)
+
+    # A removed file is noticed even though every remaining file is unchanged
+    os.remove(source / "folder" / "sub0" / "file0.txt")
+    zip_appropriately(str(source), str(target), incremental=True, manifest=True)
+    with zf.ZipFile(zip_fp) as z:
+        assert "sub0/file0.txt" not in z.namelist()
+        assert z.testzip() is None
+    assert "sub0/file0.txt" not in manifest_fp.read_text()
+
+
+@pytest.mark.parametrize("compression", ["deflated", "bzip2", "lzma"])
+def test_parallel_zips_identical_to_serial(tmp_path, compression):
+    source = tmp_path / "source"
+    rng = random.Random(0)
+    for f in range(6):
+        for i in range(15):
+            path = source / f"folder{f}" / f"sub{i % 3}" / f"file{i}.{'bin' if i % 5 == 0 else 'txt'}"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Random payloads are stored, text is compressed
+            path.write_bytes(os.urandom(20_000) if i % 5 == 0 else f"line {i}\n".encode() * rng.randint(1, 5000))
+
+    zip_appropriately(str(source), str(tmp_path / "serial"), jobs=1, compression=COMPRESSIONS[compression])
+    zip_appropriately(str(source), str(tmp_path / "parallel"), jobs=4, compression=COMPRESSIONS[compression])
+
+    for f in range(6):
+        serial, parallel = tmp_path / "serial" / f"folder{f}.zip", tmp_path / "parallel" / f"folder{f}.zip"
+        assert serial.read_bytes() == parallel.read_bytes()
+        # Round trip: the raw-appended members read back with matching CRCs and content
+        with zf.ZipFile(parallel) as z:
+            assert z.testzip() is None
+            for info in z.infolist():
+                assert z.read(info) == (source / f"folder{f}" / info.filename).read_bytes()
+
+
+@pytest.mark.parametrize("name", ["data.tar.gz", "DATA.TAR.GZ", "data.tar.bz2", "data.tar.xz", "data.tgz", "plot.PNG"])
+def test_compressed_payloads_are_stored(name):
+    assert choose_compression(name, b"compressible text " * 100) == zf.ZIP_STORED
+
+
+def test_text_is_compressed():
+    assert choose_compression("notes.txt", b"compressible text " * 100) == zf.ZIP_DEFLATED